@@ -1,23 +1,64 @@
-from flask import Blueprint, request, jsonify
-from pymongo import MongoClient
+from flask import Blueprint, Response, current_app, request, jsonify, stream_with_context
 from bson import ObjectId
 import os
+import json
+import time
 from datetime import datetime
 from flask_login import current_user, login_required
-import assemblyai as aai
-from elevenlabs.client import ElevenLabs
 import requests
-from werkzeug.utils import secure_filename
+from pagination import paginate, page_size
+from cache import PRODUCTS_CACHE_PREFIX, catalog_cache, make_key, MISSING
+from database import db, catalog_db
+from users import user_cache_stats
+from metrics import token_required
+from transcription import (
+    TERMINAL_STATUSES,
+    TranscriptionBusy,
+    get_job as get_transcription_job,
+    serialize_job,
+    transcription_service
+)
+from tts import VOICE_MAP, speech_cache
+from images import InvalidImage, image_pipeline
+from notifications import changes as notification_changes, mark_read, serialize_notification, unread_count
+import seller_stats
+import cart
+from jobs import create_job, find_jobs_for_args, serialize_job as serialize_job_listing
+from refs import normalize, ref
+from bson_json import stream_array
+from imports import (
+    ImportBusy,
+    InvalidArchive,
+    get_job as get_import_job,
+    product_importer,
+    serialize_job as serialize_import_job
+)
+import exports
 
 api = Blueprint('api', __name__)
 
-# MongoDB configuration
-client = MongoClient(os.getenv('MONGODB_URI'))
-db = client.udyambharat
+# List views never render the full description; it is served by the
+# single-product endpoint instead
+PRODUCT_LIST_PROJECTION = {'description': 0}
 
-# Configure API keys
-aai.settings.api_key = os.getenv("ASSEMBLYAI_API_KEY")
-elevenlabs_client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+# Lower bounds of the price ranges reported by product search facets. The
+# last boundary is an open-ended sentinel so every price lands in a bucket.
+PRICE_BUCKETS = [0, 250, 500, 1000, 2500, 5000, float('inf')]
+
+# Server-sent transcription status: how often to check the job and how
+# long to hold the connection before the client falls back to polling
+TRANSCRIPTION_EVENTS_INTERVAL = 0.5  # seconds
+TRANSCRIPTION_EVENTS_TIMEOUT = 120  # seconds
+
+# Notification pushes only read the user's counter while nothing changes.
+# Each open stream holds a worker thread, so they are only served when
+# NOTIFICATION_UPDATES is 'events' (see config.py); otherwise pages poll
+# the unread count. Connections are closed after the timeout so a worker
+# is not held indefinitely; EventSource reconnects after
+# NOTIFICATION_EVENTS_RETRY.
+NOTIFICATION_EVENTS_INTERVAL = 2  # seconds
+NOTIFICATION_EVENTS_TIMEOUT = 55  # seconds
+NOTIFICATION_EVENTS_RETRY = 3000  # milliseconds
 
 @api.route('/api/products', methods=['GET'])
 def get_products():
@@ -30,12 +71,127 @@ def get_products():
     if district:
         query['district'] = district
     
-    products = list(db.products.find(query))
-    for product in products:
-        product['_id'] = str(product['_id'])
-        product['seller_id'] = str(product['seller_id'])
+    cursor = request.args.get('cursor')
+    limit = page_size(request.args.get('limit'))
+    
+    def load_page():
+        products, next_cursor = paginate(
+            catalog_db.products,
+            query,
+            'created_at',
+            cursor_token=cursor,
+            limit=limit,
+            projection=PRODUCT_LIST_PROJECTION
+        )
+        return {'products': products, 'next': next_cursor}
+    
+    key = make_key('products:list', category=category, district=district, cursor=cursor, limit=limit)
+    try:
+        return jsonify(catalog_cache.get_or_set(key, load_page))
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+@api.route('/api/products/search', methods=['GET'])
+def search_products():
+    text = request.args.get('q', '').strip()
+    if not text:
+        return jsonify({'error': 'Search text is required'}), 400
+    
+    category = request.args.get('category')
+    district = request.args.get('district')
+    limit = page_size(request.args.get('limit'))
+    page = max(1, request.args.get('page', 1, type=int))
+    
+    key = make_key('products:search', q=text, category=category, district=district, limit=limit, page=page)
+    cached = catalog_cache.get(key)
+    if cached is not MISSING:
+        return jsonify(cached)
+    
+    category_filter = {'category': category} if category else {}
+    district_filter = {'district': district} if district else {}
+    filters = {**category_filter, **district_filter}
+    
+    # $text must be the first stage; everything else is computed from the
+    # same matched set in one $facet. Each facet applies the other
+    # filters but not its own, so the counts show what selecting a
+    # different category or district would return.
+    pipeline = [
+        {'$match': {'$text': {'$search': text}}},
+        {'$addFields': {'score': {'$meta': 'textScore'}}},
+        {'$facet': {
+            'products': [
+                {'$match': filters},
+                {'$sort': {'score': -1, '_id': -1}},
+                {'$skip': (page - 1) * limit},
+                {'$limit': limit},
+                {'$project': PRODUCT_LIST_PROJECTION}
+            ],
+            'total': [
+                {'$match': filters},
+                {'$count': 'count'}
+            ],
+            'categories': [
+                {'$match': district_filter},
+                {'$sortByCount': '$category'}
+            ],
+            'districts': [
+                {'$match': category_filter},
+                {'$sortByCount': '$district'}
+            ],
+            'prices': [
+                {'$match': filters},
+                {'$bucket': {
+                    'groupBy': '$price',
+                    'boundaries': PRICE_BUCKETS,
+                    'default': 'other',
+                    'output': {'count': {'$sum': 1}}
+                }}
+            ]
+        }}
+    ]
+    result = next(catalog_db.products.aggregate(pipeline), None) or {}
+    
+    products = result.get('products', [])
+    
+    total = result.get('total', [])
+    price_ranges = []
+    for bucket in result.get('prices', []):
+        if bucket['_id'] == 'other':
+            continue
+        upper = PRICE_BUCKETS.index(bucket['_id']) + 1
+        price_ranges.append({
+            'min': bucket['_id'],
+            'max': PRICE_BUCKETS[upper] if upper < len(PRICE_BUCKETS) - 1 else None,
+            'count': bucket['count']
+        })
+    
+    response = {
+        'products': products,
+        'total': total[0]['count'] if total else 0,
+        'page': page,
+        'facets': {
+            'category': [{'value': f['_id'], 'count': f['count']} for f in result.get('categories', [])],
+            'district': [{'value': f['_id'], 'count': f['count']} for f in result.get('districts', [])],
+            'price': price_ranges
+        }
+    }
+    catalog_cache.set(key, response)
+    return jsonify(response)
+
+@api.route('/api/products/<product_id>', methods=['GET'])
+def get_product(product_id):
+    if not ObjectId.is_valid(product_id):
+        return jsonify({'error': 'Product not found'}), 404
+    
+    key = make_key('products:detail', id=product_id)
+    product = catalog_cache.get(key)
+    if product is MISSING:
+        product = catalog_db.products.find_one({'_id': ObjectId(product_id)})
+        if not product:
+            return jsonify({'error': 'Product not found'}), 404
+        catalog_cache.set(key, product)
     
-    return jsonify(products)
+    return jsonify(product)
 
 @api.route('/api/products', methods=['POST'])
 @login_required
@@ -60,36 +216,31 @@ def create_product():
             'description': description,
             'price': price,
             'district': district,
-            'seller_id': ObjectId(current_user.id),
+            'seller_id': current_user.id,
             'seller_name': current_user.name,
             'created_at': datetime.utcnow()
         }
         
-        # Handle image upload
+        # Handle image upload; resized copies are rendered in the background
         try:
-            # Create uploads directory if it doesn't exist
-            upload_dir = os.path.join('UdyamBharat', 'static', 'uploads')
-            os.makedirs(upload_dir, exist_ok=True)
-            
-            # Generate secure filename with timestamp
-            filename = secure_filename(f"{datetime.utcnow().timestamp()}_{image.filename}")
-            image_path = os.path.join(upload_dir, filename)
-            
-            # Save the image
-            image.save(image_path)
-            
-            # Set the image URL relative to static folder
-            product['image_url'] = f'/static/uploads/{filename}'
+            image_hash, images, future = image_pipeline.submit(image.read())
+        except InvalidImage:
+            return jsonify({'error': 'Product image must be a valid image file'}), 400
         except Exception as e:
             print(f"Image upload error: {str(e)}")
             return jsonify({'error': 'Failed to upload image'}), 500
         
-        # Save to database
-        result = db.products.insert_one(product)
+        product['image_hash'] = image_hash
+        product['images'] = images
+        product['image_url'] = images['card']['jpeg']
+        product['image_status'] = 'processing' if future else 'ready'
         
-        # Convert ObjectId to string for JSON serialization
-        product['_id'] = str(result.inserted_id)
-        product['seller_id'] = str(product['seller_id'])
+        # Save to database
+        db.products.insert_one(normalize('products', product))
+        catalog_cache.delete_prefix(PRODUCTS_CACHE_PREFIX)
+        seller_stats.adjust_products(db, current_user.id, 1)
+        if future:
+            image_pipeline.mark_when_done(image_hash, future)
         
         return jsonify(product), 201
     
@@ -97,6 +248,40 @@ def create_product():
         print(f"Product creation error: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/products/import', methods=['POST'])
+@login_required
+def import_products():
+    if current_user.role != 'seller':
+        return jsonify({'error': 'Only sellers can import products'}), 403
+    
+    products_csv = request.files.get('csv')
+    archive = request.files.get('images')
+    if not products_csv or not archive:
+        return jsonify({'error': 'A CSV file and a zip file of images are required'}), 400
+    
+    try:
+        job_id = product_importer.submit(products_csv.stream, archive.stream, current_user.id, current_user.name)
+    except InvalidArchive as e:
+        return jsonify({'error': str(e)}), 400
+    except ImportBusy:
+        response = jsonify({'error': 'Too many imports in progress, please try again shortly'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    return jsonify({
+        'job_id': str(job_id),
+        'status': 'queued',
+        'status_url': f'/api/products/import/{job_id}'
+    }), 202
+
+@api.route('/api/products/import/<job_id>', methods=['GET'])
+@login_required
+def get_product_import(job_id):
+    job = get_import_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'error': 'Import not found'}), 404
+    return jsonify(serialize_import_job(job))
+
 @api.route('/api/products/<product_id>', methods=['PUT'])
 @login_required
 def update_product(product_id):
@@ -116,6 +301,7 @@ def update_product(product_id):
     }
     
     db.products.update_one({'_id': ObjectId(product_id)}, {'$set': update_data})
+    catalog_cache.delete_prefix(PRODUCTS_CACHE_PREFIX)
     return jsonify({'message': 'Product updated successfully'})
 
 @api.route('/api/products/<product_id>', methods=['DELETE'])
@@ -134,19 +320,25 @@ def delete_product(product_id):
         if str(product['seller_id']) != current_user.id:
             return jsonify({'error': 'You can only delete your own products'}), 403
         
-        # Delete the product image if it exists and is not the default image
-        if 'image_url' in product and product['image_url'] != '/static/images/default-product.jpg':
-            try:
-                image_path = os.path.join('UdyamBharat', product['image_url'].lstrip('/'))
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            except Exception as e:
-                print(f"Error deleting product image: {str(e)}")
-        
         # Delete the product from database
         result = db.products.delete_one({'_id': ObjectId(product_id)})
+        catalog_cache.delete_prefix(PRODUCTS_CACHE_PREFIX)
         if result.deleted_count == 0:
             return jsonify({'error': 'Failed to delete product'}), 500
+        seller_stats.adjust_products(db, current_user.id, -1)
+        
+        # Images are shared by content hash; only remove them once no other
+        # product uses the same photo
+        try:
+            if product.get('image_hash'):
+                if not db.products.find_one({'image_hash': product['image_hash']}, {'_id': 1}):
+                    image_pipeline.remove(product['image_hash'])
+            elif product.get('image_url', '').startswith('/static/uploads/'):
+                image_path = os.path.join(current_app.config['UPLOAD_FOLDER'], os.path.basename(product['image_url']))
+                if os.path.exists(image_path):
+                    os.remove(image_path)
+        except Exception as e:
+            print(f"Error deleting product image: {str(e)}")
         
         return jsonify({'message': 'Product deleted successfully'}), 200
     
@@ -158,17 +350,40 @@ def delete_product(product_id):
 @login_required
 def get_orders():
     if current_user.role == 'seller':
-        orders = list(db.orders.find({'seller_id': current_user.id}))
+        orders = db.orders.find({'seller_id': ref(current_user.id)})
     else:
-        orders = list(db.orders.find({'buyer_id': current_user.id}))
+        orders = db.orders.find({'buyer_id': ref(current_user.id)})
+    
+    # A seller's full order list can be large; send it as it is read
+    return stream_array(current_app, orders)
+
+@api.route('/api/orders/export', methods=['GET'])
+@login_required
+def export_orders():
+    if current_user.role != 'seller':
+        return jsonify({'error': 'Only sellers can export orders'}), 403
     
-    for order in orders:
-        order['_id'] = str(order['_id'])
-        order['product_id'] = str(order['product_id'])
-        order['buyer_id'] = str(order['buyer_id'])
-        order['seller_id'] = str(order['seller_id'])
+    format = request.args.get('format', 'csv')
+    if format not in exports.FORMATS:
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    try:
+        start = exports.parse_date(request.args.get('from'))
+        end = exports.parse_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates in YYYY-MM-DD format'}), 400
+    if start and end and start > end:
+        return jsonify({'error': 'from must not be after to'}), 400
     
-    return jsonify(orders)
+    gzip = 'gzip' in request.accept_encodings
+    body = exports.export_orders(db, current_user.id, format, start, end, gzip)
+    filename = '-'.join(['orders'] + [day.strftime('%Y%m%d') for day in (start, end) if day])
+    headers = {
+        'Content-Disposition': f'attachment; filename="{filename}.{format}"',
+        'Vary': 'Accept-Encoding'
+    }
+    if gzip:
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(body), mimetype=exports.FORMATS[format], headers=headers)
 
 @api.route('/api/orders', methods=['POST'])
 @login_required
@@ -181,17 +396,19 @@ def create_order():
     if not product:
         return jsonify({'error': 'Product not found'}), 404
     
+    quantity = int(data['quantity'])
     order = {
-        'product_id': data['product_id'],
+        'product_id': product['_id'],
         'buyer_id': current_user.id,
         'seller_id': product['seller_id'],
-        'quantity': int(data['quantity']),
+        'quantity': quantity,
+        'total_price': product['price'] * quantity,
         'status': 'pending',
         'created_at': datetime.utcnow()
     }
     
-    result = db.orders.insert_one(order)
-    order['_id'] = str(result.inserted_id)
+    db.orders.insert_one(normalize('orders', order))
+    seller_stats.orders_placed(db, [order], {str(product['_id']): product['name']})
     return jsonify(order), 201
 
 @api.route('/api/orders/<order_id>', methods=['PUT'])
@@ -201,29 +418,43 @@ def update_order_status(order_id):
         return jsonify({'error': 'Only sellers can update order status'}), 403
     
     data = request.json
+    status = data.get('status')
+    if status not in seller_stats.ORDER_STATUSES:
+        return jsonify({'error': f"Status must be one of: {', '.join(seller_stats.ORDER_STATUSES)}"}), 400
+    
     order = db.orders.find_one({'_id': ObjectId(order_id)})
     if not order or str(order['seller_id']) != current_user.id:
         return jsonify({'error': 'Order not found'}), 404
     
-    db.orders.update_one(
+    # The previous status is read in the same operation as the update, so
+    # concurrent changes to one order move each count exactly once
+    previous = db.orders.find_one_and_update(
         {'_id': ObjectId(order_id)},
-        {'$set': {'status': data['status']}}
+        {'$set': {'status': status}},
+        projection={'status': 1}
     )
+    if not previous:
+        return jsonify({'error': 'Order not found'}), 404
+    seller_stats.order_status_changed(db, current_user.id, order['_id'], previous['status'], status)
     return jsonify({'message': 'Order status updated successfully'})
 
+def _cart_quantity(value):
+    # Returns value as a positive int, or None
+    try:
+        quantity = int(value)
+    except (TypeError, ValueError):
+        return None
+    return quantity if quantity > 0 else None
+
 @api.route('/api/cart', methods=['GET'])
 @login_required
 def get_cart():
     if current_user.role != 'buyer':
         return jsonify({'error': 'Only buyers can access cart'}), 403
     
-    cart = db.cart.find_one({'buyer_id': current_user.id})
-    if not cart:
-        return jsonify({'items': []})
-    
-    cart['_id'] = str(cart['_id'])
-    cart['buyer_id'] = str(cart['buyer_id'])
-    return jsonify(cart)
+    items = cart.get_items(db, current_user.id)
+    total = sum(item['product']['price'] * item['quantity'] for item in items)
+    return jsonify({'items': items, 'total': total})
 
 @api.route('/api/cart', methods=['POST'])
 @login_required
@@ -231,117 +462,111 @@ def add_to_cart():
     if current_user.role != 'buyer':
         return jsonify({'error': 'Only buyers can add to cart'}), 403
     
-    data = request.json
-    product = db.products.find_one({'_id': ObjectId(data['product_id'])})
-    if not product:
-        return jsonify({'error': 'Product not found'}), 404
+    data = request.get_json(silent=True) or {}
+    if not ObjectId.is_valid(data.get('product_id')):
+        return jsonify({'error': 'Invalid product id'}), 400
+    quantity = _cart_quantity(data.get('quantity', 1))
+    if quantity is None:
+        return jsonify({'error': 'Quantity must be a positive number'}), 400
     
-    cart = db.cart.find_one({'buyer_id': current_user.id})
-    if not cart:
-        cart = {
-            'buyer_id': current_user.id,
-            'items': [{
-                'product_id': data['product_id'],
-                'quantity': int(data['quantity'])
-            }]
-        }
-        db.cart.insert_one(cart)
-    else:
-        item_exists = False
-        for item in cart['items']:
-            if item['product_id'] == data['product_id']:
-                item['quantity'] += int(data['quantity'])
-                item_exists = True
-                break
-        
-        if not item_exists:
-            cart['items'].append({
-                'product_id': data['product_id'],
-                'quantity': int(data['quantity'])
-            })
-        
-        db.cart.update_one(
-            {'buyer_id': current_user.id},
-            {'$set': {'items': cart['items']}}
-        )
+    if not db.products.find_one({'_id': ObjectId(data['product_id'])}, {'_id': 1}):
+        return jsonify({'error': 'Product not found'}), 404
     
+    cart.add_item(db, current_user.id, data['product_id'], quantity)
     return jsonify({'message': 'Item added to cart successfully'})
 
+@api.route('/api/cart/<product_id>', methods=['PUT'])
+@login_required
+def update_cart_item(product_id):
+    if current_user.role != 'buyer':
+        return jsonify({'error': 'Only buyers can update cart'}), 403
+    
+    if not ObjectId.is_valid(product_id):
+        return jsonify({'error': 'Invalid product id'}), 400
+    data = request.get_json(silent=True) or {}
+    try:
+        quantity = int(data.get('quantity'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Quantity must be a number'}), 400
+    
+    # A quantity of 0 or less removes the item
+    if not cart.set_quantity(db, current_user.id, product_id, quantity):
+        return jsonify({'error': 'Item not found in cart'}), 404
+    return jsonify({'message': 'Cart updated successfully'})
+
 @api.route('/api/cart/<product_id>', methods=['DELETE'])
 @login_required
 def remove_from_cart(product_id):
     if current_user.role != 'buyer':
         return jsonify({'error': 'Only buyers can remove from cart'}), 403
     
-    cart = db.cart.find_one({'buyer_id': current_user.id})
-    if not cart:
-        return jsonify({'error': 'Cart not found'}), 404
-    
-    cart['items'] = [item for item in cart['items'] if item['product_id'] != product_id]
+    if not ObjectId.is_valid(product_id):
+        return jsonify({'error': 'Invalid product id'}), 400
     
-    if not cart['items']:
-        db.cart.delete_one({'buyer_id': current_user.id})
-    else:
-        db.cart.update_one(
-            {'buyer_id': current_user.id},
-            {'$set': {'items': cart['items']}}
-        )
+    if not cart.remove_item(db, current_user.id, product_id):
+        return jsonify({'error': 'Item not found in cart'}), 404
     
     return jsonify({'message': 'Item removed from cart successfully'})
 
-@api.route('/api/voice/transcribe', methods=['POST'])
+@api.route('/api/voice/transcribe/jobs', methods=['POST'])
 @login_required
-def transcribe_voice():
+def submit_transcription():
+    audio_file = request.files.get('audio')
+    language = request.form.get('language', 'en')
+    
+    if not audio_file:
+        return jsonify({'error': 'No audio file provided'}), 400
+    
     try:
-        audio_file = request.files.get('audio')
-        language = request.form.get('language', 'en')
-        
-        if not audio_file:
-            return jsonify({'error': 'No audio file provided'}), 400
-        
-        # Map frontend language codes to AssemblyAI language codes
-        language_map = {
-            'en': 'en',
-            'hi': 'hi',
-            'doi': 'hi'  # Dogri uses Hindi as base language
-        }
-        
-        assembly_language = language_map.get(language, 'en')
-        
-        # Save audio file temporarily
-        filename = secure_filename(f"voice_input_{datetime.utcnow().timestamp()}.wav")
-        filepath = os.path.join('static', 'temp', filename)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
-        audio_file.save(filepath)
-        
-        # Configure transcription
-        config = aai.TranscriptionConfig(
-            language_code=assembly_language,
-            punctuate=True,
-            format_text=True,
-            audio_format='wav'
-        )
-        
-        # Create transcriber
-        transcriber = aai.Transcriber(config=config)
-        
-        # Transcribe audio
-        transcript = transcriber.transcribe(filepath)
-        
-        # Clean up temporary file
-        try:
-            os.remove(filepath)
-        except:
-            pass  # Ignore cleanup errors
-        
-        return jsonify({
-            'transcript': transcript.text,
-            'confidence': transcript.confidence,
-            'language': language
-        })
+        job_id = transcription_service.submit(audio_file.stream, language, current_user.id)
+    except TranscriptionBusy:
+        response = jsonify({'error': 'Too many transcriptions in progress, please try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
     
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'job_id': str(job_id),
+        'status': 'queued',
+        'status_url': f'/api/voice/transcribe/jobs/{job_id}',
+        'events_url': f'/api/voice/transcribe/jobs/{job_id}/events'
+    }), 202
+
+@api.route('/api/voice/transcribe/jobs/<job_id>', methods=['GET'])
+@login_required
+def get_transcription(job_id):
+    job = get_transcription_job(job_id, current_user.id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(serialize_job(job))
+
+@api.route('/api/voice/transcribe/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def transcription_events(job_id):
+    user_id = current_user.id
+    if not get_transcription_job(job_id, user_id):
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events():
+        # Emit each status change, then close once the job is finished or
+        # the client has waited long enough to fall back to polling
+        last_status = None
+        deadline = time.monotonic() + TRANSCRIPTION_EVENTS_TIMEOUT
+        while time.monotonic() < deadline:
+            job = get_transcription_job(job_id, user_id)
+            if job is None:
+                break
+            if job['status'] != last_status:
+                last_status = job['status']
+                yield f"event: status\ndata: {json.dumps(serialize_job(job))}\n\n"
+            if last_status in TERMINAL_STATUSES:
+                break
+            time.sleep(TRANSCRIPTION_EVENTS_INTERVAL)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @api.route('/api/voice/synthesize', methods=['POST'])
 @login_required
@@ -353,35 +578,95 @@ def synthesize_voice():
         if not text:
             return jsonify({'error': 'No text provided'}), 400
         
-        # Select voice based on language
-        voice_map = {
-            'en': 'Rachel',  # English voice
-            'hi': 'Priya',   # Hindi voice
-            'doi': 'Priya'   # Dogri voice (using Hindi voice as fallback)
-        }
-        voice = voice_map.get(language, 'Rachel')
-        
-        # Generate audio using ElevenLabs client
-        audio = elevenlabs_client.generate(
-            text=text,
-            voice=voice,
-            model="eleven_multilingual_v2"
-        )
-        
-        # Save audio file
-        filename = f'notification_{datetime.utcnow().timestamp()}.mp3'
-        filepath = os.path.join('static', 'audio', filename)
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Identical text and voice reuse the stored audio
+        voice = VOICE_MAP.get(language, 'Rachel')
+        audio_url, cached = speech_cache.get_or_synthesize(text, voice)
         
-        # Save the audio content
-        with open(filepath, 'wb') as f:
-            f.write(audio)
-        
-        return jsonify({'audio_url': f'/static/audio/{filename}'})
+        return jsonify({'audio_url': audio_url, 'cached': cached})
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@api.route('/api/notifications/unread_count', methods=['GET'])
+@login_required
+def get_unread_count():
+    return jsonify({'unread': unread_count(db, current_user.id)})
+
+@api.route('/api/notifications/mark_read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    # {"ids": [...]} marks those notifications; no ids marks all of them
+    ids = (request.get_json(silent=True) or {}).get('ids')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, str) and ObjectId.is_valid(i) for i in ids):
+            return jsonify({'error': 'ids must be a list of notification ids'}), 400
+        ids = [ObjectId(i) for i in ids]
+    
+    marked = mark_read(db, current_user.id, ids)
+    return jsonify({'marked': marked, 'unread': unread_count(db, current_user.id)})
+
+@api.route('/api/notifications/events', methods=['GET'])
+@login_required
+def notification_events():
+    if current_app.config['NOTIFICATION_UPDATES'] != 'events':
+        # 204 tells EventSource not to reconnect
+        return '', 204
+    user_id = current_user.id
+    
+    def events():
+        yield f"retry: {NOTIFICATION_EVENTS_RETRY}\n\n"
+        for event, payload in notification_changes(db, user_id, NOTIFICATION_EVENTS_INTERVAL, NOTIFICATION_EVENTS_TIMEOUT):
+            if event == 'notification':
+                payload = serialize_notification(payload)
+            else:
+                payload = {'unread': payload}
+            yield f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@api.route('/api/jobs', methods=['GET'])
+@login_required
+def get_jobs():
+    if current_user.role != 'seller':
+        return jsonify({'error': 'Only sellers can view job listings'}), 403
+    
+    try:
+        jobs, next_cursor = find_jobs_for_args(db, request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'jobs': [serialize_job_listing(job) for job in jobs], 'next': next_cursor})
+
+@api.route('/api/jobs', methods=['POST'])
+@login_required
+def post_job():
+    if current_user.role != 'seller':
+        return jsonify({'error': 'Only sellers can post jobs'}), 403
+    
+    title = request.form.get('title', '').strip()
+    description = request.form.get('description', '').strip()
+    location = request.form.get('location', '').strip()
+    if not title or not description or not location:
+        return jsonify({'error': 'Title, description and location are required'}), 400
+    
+    try:
+        job = create_job(
+            db,
+            current_user.id,
+            title,
+            description,
+            location,
+            request.form.get('latitude'),
+            request.form.get('longitude')
+        )
+    except ValueError:
+        return jsonify({'error': 'Invalid coordinates'}), 400
+    seller_stats.adjust_jobs(db, current_user.id, 1)
+    return jsonify({'message': 'Job posted successfully', 'job': serialize_job_listing(job)}), 201
+
 @api.route('/api/jobs/<job_id>', methods=['DELETE'])
 @login_required
 def delete_job(job_id):
@@ -399,8 +684,18 @@ def delete_job(job_id):
         result = db.jobs.delete_one({'_id': ObjectId(job_id)})
         if result.deleted_count == 0:
             return jsonify({'error': 'Failed to delete job'}), 500
+        seller_stats.adjust_jobs(db, current_user.id, -1)
         
         return jsonify({'message': 'Job deleted successfully'}), 200
     
     except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500 
+
+@api.route('/api/cache/stats', methods=['GET'])
+@token_required
+def cache_stats():
+    return jsonify({
+        'catalog': catalog_cache.stats(),
+        'users': user_cache_stats(),
+        'speech': speech_cache.stats()
+    })
\ No newline at end of file
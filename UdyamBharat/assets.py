@@ -0,0 +1,204 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import tempfile
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.security import safe_join
+from cache import LRUCache, MISSING
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Static assets are served from a build made by `python assets.py`:
+#   - every file under static/ (apart from runtime folders) is copied to
+#     static/dist/ with a content hash in its name, e.g.
+#     css/style.css -> dist/css/style.3f9a1c2b7d4e.css
+#   - text assets also get .gz and .br siblings, compressed once at build
+#     time instead of on every request
+#   - dist/manifest.json maps the original names to the hashed ones
+#
+# url_for('static', filename='css/style.css') then returns the hashed URL,
+# which never changes content and is served with a one-year immutable
+# Cache-Control and the best encoding the client accepts. Without a
+# manifest (e.g. in development) the original URLs are used unchanged.
+#
+# Product images in static/uploads are served with a strong ETag taken
+# from their content, so revalidation returns 304 without a body. Images
+# named by images.ImagePipeline are content-addressed and are immutable too.
+
+ASSET_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+# Written at runtime and served by their own rules
+SKIP_DIRS = {ASSET_DIR, 'uploads', 'audio'}
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+# Below this, compression headers cost more than they save
+MIN_COMPRESS_BYTES = 1024
+# Preferred first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}-\w+\.\w+$')
+
+
+def _hashed_name(path, digest):
+    root, ext = os.path.splitext(path)
+    return f'{root}.{digest[:12]}{ext}'
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _compress(data):
+    # Returns {encoding: bytes}, keeping only versions that are smaller
+    versions = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        versions['br'] = brotli.compress(data, quality=11)
+    return {encoding: body for encoding, body in versions.items() if len(body) < len(data)}
+
+
+def build(static_folder):
+    # Files from earlier builds are kept so pages cached before a deploy
+    # can still load the assets they reference
+    out = os.path.join(static_folder, ASSET_DIR)
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        if dirpath == static_folder:
+            dirnames[:] = [name for name in dirnames if name not in SKIP_DIRS]
+        for filename in filenames:
+            source = os.path.join(dirpath, filename)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as f:
+                data = f.read()
+
+            hashed = _hashed_name(logical, hashlib.sha256(data).hexdigest())
+            target = os.path.join(out, *hashed.split('/'))
+            _write(target, data)
+
+            encodings = []
+            if os.path.splitext(filename)[1].lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_BYTES:
+                compressed = _compress(data)
+                for encoding, suffix in ENCODINGS:
+                    if encoding in compressed:
+                        _write(target + suffix, compressed[encoding])
+                        encodings.append(encoding)
+
+            manifest[logical] = {'path': hashed, 'encodings': encodings}
+
+    _write(os.path.join(out, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class Assets:
+    def __init__(self, app):
+        self.dist_folder = os.path.join(app.static_folder, ASSET_DIR)
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.upload_prefix = os.path.relpath(self.upload_folder, app.static_folder).replace(os.sep, '/') + '/'
+        self.max_age = app.config['ASSET_MAX_AGE']
+        self.manifest = self._load_manifest()
+        self.encodings = {entry['path']: entry['encodings'] for entry in self.manifest.values()}
+        # Upload ETags keyed by path, mtime and size, so a replaced file is
+        # hashed again
+        self._etags = LRUCache(app.config['ASSET_ETAG_CACHE_MAX_ENTRIES'], ttl=86400)
+
+    def _load_manifest(self):
+        try:
+            with open(os.path.join(self.dist_folder, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def url_defaults(self, endpoint, values):
+        if endpoint == 'static':
+            entry = self.manifest.get(values.get('filename'))
+            if entry:
+                values['filename'] = f"{ASSET_DIR}/{entry['path']}"
+
+    def serve(self, filename):
+        if filename.startswith(ASSET_DIR + '/'):
+            path = filename[len(ASSET_DIR) + 1:]
+            if path in self.encodings:
+                return self._send_hashed(path)
+        elif filename.startswith(self.upload_prefix):
+            return self._send_upload(filename[len(self.upload_prefix):])
+        return current_app.send_static_file(filename)
+
+    def _send_hashed(self, path):
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        encoding = next(
+            (
+                (name, suffix) for name, suffix in ENCODINGS
+                if name in self.encodings[path] and request.accept_encodings.quality(name) > 0
+            ),
+            None
+        )
+        response = send_from_directory(
+            self.dist_folder,
+            path + encoding[1] if encoding else path,
+            mimetype=mimetype,
+            max_age=self.max_age
+        )
+        if encoding:
+            response.headers['Content-Encoding'] = encoding[0]
+        if self.encodings[path]:
+            response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        return response
+
+    def _etag(self, path):
+        stat = os.stat(path)
+        key = f'{path}:{stat.st_mtime_ns}:{stat.st_size}'
+        etag = self._etags.get(key)
+        if etag is MISSING:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(64 * 1024), b''):
+                    digest.update(chunk)
+            etag = digest.hexdigest()
+            self._etags.set(key, etag)
+        return etag
+
+    def _send_upload(self, name):
+        path = safe_join(self.upload_folder, name)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+
+        immutable = CONTENT_ADDRESSED.match(os.path.basename(name)) is not None
+        response = send_from_directory(
+            self.upload_folder,
+            name,
+            etag=self._etag(path),
+            max_age=self.max_age if immutable else None
+        )
+        if immutable:
+            response.cache_control.immutable = True
+        else:
+            # Legacy uploads keep their name when replaced; revalidate with
+            # the ETag every time
+            response.cache_control.public = True
+            response.cache_control.no_cache = True
+        return response
+
+
+def init_app(app):
+    assets = Assets(app)
+    app.extensions['assets'] = assets
+    app.url_defaults(assets.url_defaults)
+    app.view_functions['static'] = assets.serve
+
+
+if __name__ == '__main__':
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    manifest = build(static_folder)
+    print(f"Built {len(manifest)} assets into {os.path.join(static_folder, ASSET_DIR)}")
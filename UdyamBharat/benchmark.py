@@ -0,0 +1,527 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+import bcrypt
+from pymongo import MongoClient, monitoring
+
+# Load benchmark for the main routes. It seeds a throwaway database with
+# synthetic sellers, products, orders and notifications, replaces
+# AssemblyAI, ElevenLabs and Gemini with local fakes, and drives each
+# scenario from --clients concurrent logged-in clients through Flask's test
+# client (in process, so the figures are the app and MongoDB, not an HTTP
+# server). For every scenario it reports throughput, p50/p95/p99 latency
+# and MongoDB round trips per request.
+#
+#   python benchmark.py [--mongo-uri URI | --in-memory] [--clients N] ...
+#   python benchmark.py --save-baseline        # record benchmark_baseline.json
+#   python benchmark.py --compare              # exit 1 on a regression
+#   python benchmark.py --startup [--runs N]   # import and first-request time
+#   python benchmark.py login --bcrypt-rounds 10 12   # login throughput by cost
+#   python benchmark.py --query-shapes shapes.jsonl   # then indexes.py audit
+#
+# The seeded database (--db, udyambharat_bench by default) is dropped
+# first, so never point it at real data. --in-memory runs against
+# mongomock (pip install mongomock); its latencies say little about a real
+# server, but round trips per request are counted the same way.
+#
+# --compare needs a baseline recorded with the same settings. Latency and
+# throughput are only compared for runs against a real server, and only
+# mean something on the machine the baseline was recorded on; round trips
+# per request compare anywhere.
+#
+# Seeded users get passwords hashed with the first --bcrypt-rounds cost
+# (4 by default, so logging clients in stays cheap). The login scenario
+# runs once per cost, with every password rehashed at that cost first.
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+PASSWORD = 'benchmark'
+CATEGORIES = ('handicrafts', 'textiles', 'food', 'agriculture', 'pottery')
+DISTRICTS = ('Jammu', 'Kathua', 'Udhampur', 'Samba', 'Reasi', 'Doda')
+ORDER_STATUSES = ('pending', 'processing', 'completed')
+
+# Allowed change before a metric counts as a regression
+LATENCY_THRESHOLD = 0.20  # p50/p95/p99 may be up to 20% slower
+THROUGHPUT_THRESHOLD = 0.20  # requests per second may drop by up to 20%
+ROUND_TRIP_THRESHOLD = 0.5  # extra MongoDB commands per request
+
+
+class CommandCounter(monitoring.CommandListener):
+    # Counts MongoDB commands per thread. pymongo publishes command events
+    # on the thread that issued the command, and the test client runs the
+    # request on the calling thread, so the difference in count() around
+    # a request is that request's round trips.
+    def __init__(self):
+        self._local = threading.local()
+
+    def count(self):
+        return getattr(self._local, 'count', 0)
+
+    def started(self, event):
+        self._local.count = self.count() + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+# mongomock does not publish command events; each of these calls is one
+# command on a real server
+MONGOMOCK_COMMANDS = (
+    'find', 'find_one', 'aggregate', 'count_documents', 'distinct', 'insert_one', 'insert_many',
+    'update_one', 'update_many', 'replace_one', 'delete_one', 'delete_many', 'bulk_write',
+    'find_one_and_update', 'find_one_and_delete', 'find_one_and_replace'
+)
+
+
+def mongo_client_factory(uri, counter):
+    from database import client_options
+
+    def create(config):
+        options = client_options(config)
+        options['event_listeners'].append(counter)
+        return MongoClient(uri or config['MONGODB_URI'], **options)
+    return create
+
+
+def in_memory_client_factory(counter):
+    import checkout
+    try:
+        import mongomock
+    except ImportError:
+        sys.exit('--in-memory needs mongomock: pip install mongomock')
+
+    def counted(method):
+        def wrapper(*args, **kwargs):
+            counter.started(None)
+            return method(*args, **kwargs)
+        return wrapper
+
+    for name in MONGOMOCK_COMMANDS:
+        setattr(mongomock.Collection, name, counted(getattr(mongomock.Collection, name)))
+    client = mongomock.MongoClient()
+    # mongomock has no ismaster command; it has no transactions either
+    checkout._transaction_support[id(client)] = False
+    return lambda config: client
+
+
+# Local stand-ins for the paid APIs, with a fixed delay in place of the
+# network call
+
+class FakeGemini:
+    def __init__(self, delay):
+        self.delay = delay
+        self.models = self
+
+    def generate_content(self, model, contents):
+        time.sleep(self.delay)
+        return FakeText(f'Answer to: {contents}')
+
+    def generate_content_stream(self, model, contents):
+        time.sleep(self.delay)
+        for word in f'Answer to: {contents}'.split():
+            yield FakeText(word + ' ')
+
+
+class FakeText:
+    def __init__(self, text):
+        self.text = text
+
+
+def fake_transcription(delay):
+    def transcribe(audio, language):
+        time.sleep(delay)
+        return {'text': 'benchmark transcript', 'confidence': 1.0}
+    return transcribe
+
+
+def fake_speech(delay):
+    def synthesize(text, voice, model):
+        time.sleep(delay)
+        return b'\xff\xfb' + text.encode('utf-8')
+    return synthesize
+
+
+def create_benchmark_app(args, counter):
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    import chatbot
+    import database
+    import transcription
+    import tts
+    from app import create_app
+
+    app = create_app(args.config)
+    app.config['MONGODB_DB'] = args.db
+    if args.query_shapes:
+        from indexes import ShapeRecorder
+        app.config['MONGODB_EVENT_LISTENERS'].append(ShapeRecorder(args.query_shapes))
+    if args.in_memory:
+        database.init_app(app, in_memory_client_factory(counter))
+    else:
+        database.init_app(app, mongo_client_factory(args.mongo_uri, counter))
+
+    delay = args.fake_latency / 1000
+    transcription.init_app(app, fake_transcription(delay))
+    tts.init_app(app, fake_speech(delay))
+    chatbot.init_app(app, lambda: FakeGemini(delay))
+    # Seeded hashes already have this cost, so logins do not rehash them
+    app.extensions['passwords'].rounds = args.bcrypt_rounds[0]
+    return app
+
+
+def set_bcrypt_rounds(app, db, rounds):
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds))
+    db.users.update_many({}, {'$set': {'password': password}})
+    app.extensions['passwords'].rounds = rounds
+
+
+def seed(db, args, rng):
+    from init_db import init_db
+
+    db.client.drop_database(db.name)
+    password = bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(args.bcrypt_rounds[0]))
+    now = datetime.utcnow()
+
+    def users(role, count):
+        docs = [{
+            'name': f'{role.title()} {i}',
+            'email': f'{role}{i}@benchmark.local',
+            'password': password,
+            'role': role,
+            'created_at': now
+        } for i in range(count)]
+        db.users.insert_many(docs)
+        return docs
+
+    sellers = users('seller', args.sellers)
+    buyers = users('buyer', args.buyers)
+
+    products = []
+    for seller in sellers:
+        for i in range(args.products):
+            products.append({
+                'name': f'Product {len(products)}',
+                'description': 'Synthetic product for benchmarking',
+                'price': rng.randint(50, 5000),
+                'category': rng.choice(CATEGORIES),
+                'district': rng.choice(DISTRICTS),
+                'seller_id': seller['_id'],
+                'seller_name': seller['name'],
+                'image_url': '/static/uploads/benchmark.jpg',
+                'image_status': 'ready',
+                'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+            })
+    if products:
+        db.products.insert_many(products)
+
+    orders = []
+    for buyer in buyers:
+        for i in range(args.orders):
+            product = rng.choice(products)
+            quantity = rng.randint(1, 5)
+            orders.append({
+                'buyer_id': buyer['_id'],
+                'seller_id': product['seller_id'],
+                'product_id': product['_id'],
+                'quantity': quantity,
+                'total_price': product['price'] * quantity,
+                'status': rng.choice(ORDER_STATUSES),
+                'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+            })
+    if orders:
+        db.orders.insert_many(orders)
+
+    notifications = [{
+        'user_id': user['_id'],
+        'message': f'Notification {i}',
+        'type': 'order',
+        'read': rng.random() < 0.5,
+        'created_at': now - timedelta(minutes=rng.randint(0, 60 * 24 * 30))
+    } for user in sellers + buyers for i in range(args.notifications)]
+    if notifications:
+        db.notifications.insert_many(notifications)
+
+    # Indexes and the summaries built from the seeded data
+    init_db(db)
+    return products
+
+
+# Scenarios: (role, prepare, request). prepare(client, rng, products) runs
+# before each request and is not timed; request(client, rng) returns the
+# response. Clients for a scenario without a role are not logged in.
+
+def _prepare_checkout(client, rng, products):
+    product = rng.choice(products)
+    client.post('/api/cart', json={'product_id': str(product['_id']), 'quantity': 1})
+
+
+SCENARIOS = {
+    'products': ('buyer', None, lambda client, rng: client.get('/api/products', query_string={
+        'category': rng.choice(CATEGORIES),
+        'district': rng.choice(DISTRICTS)
+    })),
+    'checkout': ('buyer', _prepare_checkout, lambda client, rng: client.post('/api/checkout', json={})),
+    'seller_dashboard': ('seller', None, lambda client, rng: client.get('/seller/dashboard')),
+    'order_history': ('buyer', None, lambda client, rng: client.get('/order_history')),
+    'chatbot': ('buyer', None, lambda client, rng: client.post('/api/chatbot', json={
+        'message': f'How do I sell product {rng.randint(0, 10 ** 6)}?'
+    })),
+    'login': (None, None, lambda client, rng: client.post('/login', data={
+        'email': f'buyer{rng.randint(0, 9)}@benchmark.local',
+        'password': PASSWORD
+    })),
+}
+
+
+def login(app, role, index):
+    client = app.test_client()
+    response = client.post('/login', data={
+        'email': f'{role}{index}@benchmark.local',
+        'password': PASSWORD
+    })
+    if response.status_code != 302:
+        sys.exit(f'Could not log in as {role}{index}')
+    return client
+
+
+def percentile(values, fraction):
+    # Nearest rank
+    ordered = sorted(values)
+    return ordered[max(0, int(round(fraction * len(ordered))) - 1)]
+
+
+def run_scenario(app, name, args, counter, products):
+    role, prepare, send = SCENARIOS[name]
+    if role:
+        population = args.buyers if role == 'buyer' else args.sellers
+        clients = [login(app, role, i % population) for i in range(args.clients)]
+    else:
+        clients = [app.test_client() for i in range(args.clients)]
+    latencies = []
+    round_trips = []
+    errors = []
+    lock = threading.Lock()
+    start = threading.Barrier(args.clients + 1)
+
+    def worker(index, client):
+        rng = random.Random(args.seed * 1000 + index)
+        start.wait()
+        for i in range(args.warmup + args.requests):
+            if prepare:
+                prepare(client, rng, products)
+            before = counter.count()
+            began = time.perf_counter()
+            response = send(client, rng)
+            elapsed = time.perf_counter() - began
+            trips = counter.count() - before
+            if i < args.warmup:
+                continue
+            with lock:
+                latencies.append(elapsed)
+                round_trips.append(trips)
+                if response.status_code >= 400:
+                    errors.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, args=(i, client)) for i, client in enumerate(clients)]
+    for thread in threads:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    # Includes the untimed prepare steps and warmup, so throughput is a
+    # lower bound for scenarios that have them
+    wall = time.perf_counter() - began
+
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput': round(args.clients * (args.warmup + args.requests) / wall, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'round_trips': round(sum(round_trips) / len(round_trips), 2)
+    }
+
+
+def compare(results, baseline, timings=True):
+    # Returns a list of regression messages
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if timings:
+            for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+                if result[metric] > base[metric] * (1 + LATENCY_THRESHOLD):
+                    regressions.append(f'{name}: {metric} {result[metric]} vs {base[metric]}')
+            if result['throughput'] < base['throughput'] * (1 - THROUGHPUT_THRESHOLD):
+                regressions.append(f"{name}: throughput {result['throughput']} vs {base['throughput']}")
+        if result['round_trips'] > base['round_trips'] + ROUND_TRIP_THRESHOLD:
+            regressions.append(f"{name}: round_trips {result['round_trips']} vs {base['round_trips']}")
+        if result['errors'] > base.get('errors', 0):
+            regressions.append(f"{name}: errors {result['errors']} vs {base.get('errors', 0)}")
+    return regressions
+
+
+def print_table(results, baseline=None):
+    columns = ('requests', 'errors', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms', 'round_trips')
+    print(f"{'scenario':<18}" + ''.join(f'{column:>13}' for column in columns))
+    for name, result in results.items():
+        print(f'{name:<18}' + ''.join(f'{result[column]:>13}' for column in columns))
+        base = (baseline or {}).get('scenarios', {}).get(name)
+        if base:
+            print(f"{'  baseline':<18}" + ''.join(f"{base.get(column, '-'):>13}" for column in columns))
+
+
+# Startup: each run is a fresh interpreter that imports the app, as a
+# gunicorn worker does, then serves one request that needs no database.
+# The SDKs for the paid APIs should not be loaded by either step.
+SDK_MODULES = ('assemblyai', 'elevenlabs', 'google.genai')
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+response = app.test_client().get('/login')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'first_request_ms': (served - imported) * 1000,
+    'status': response.status_code,
+    'sdks': [name for name in %r if name in sys.modules]
+}))
+''' % (SDK_MODULES,)
+
+
+def run_startup(runs):
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'benchmark')
+    samples = []
+    for i in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', STARTUP_SCRIPT],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    loaded = sorted({name for sample in samples for name in sample['sdks']})
+    for metric in ('import_ms', 'first_request_ms'):
+        values = [sample[metric] for sample in samples]
+        print(f'{metric:<18} p50 {percentile(values, 0.50):>9.1f}   max {max(values):>9.1f}')
+    if loaded:
+        print(f"SDKs loaded at startup: {', '.join(loaded)}")
+        return False
+    return True
+
+
+def settings(args):
+    return {key: getattr(args, key) for key in (
+        'in_memory', 'config', 'sellers', 'buyers', 'products', 'orders', 'notifications',
+        'clients', 'requests', 'warmup', 'fake_latency', 'seed', 'bcrypt_rounds'
+    )}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Load and latency benchmark for the main routes')
+    parser.add_argument('scenarios', nargs='*', metavar='scenario', help=', '.join(SCENARIOS))
+    parser.add_argument('--mongo-uri', help='defaults to MONGODB_URI')
+    parser.add_argument('--in-memory', action='store_true', help='use mongomock instead of a server')
+    parser.add_argument('--db', default='udyambharat_bench', help='database to drop and seed')
+    parser.add_argument('--config', default='production', help='app config name')
+    parser.add_argument('--sellers', type=int, default=20)
+    parser.add_argument('--buyers', type=int, default=50)
+    parser.add_argument('--products', type=int, default=50, help='per seller')
+    parser.add_argument('--orders', type=int, default=20, help='per buyer')
+    parser.add_argument('--notifications', type=int, default=20, help='per user')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per client')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per client')
+    parser.add_argument('--fake-latency', type=float, default=50, help='ms for each fake API call')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--bcrypt-rounds', type=int, nargs='+', default=[4], metavar='COST',
+                        help='password hash costs; the login scenario runs once per cost')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true', help='exit 1 if a metric regressed')
+    parser.add_argument('--startup', action='store_true', help='measure import and first-request time')
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes for --startup')
+    parser.add_argument('--query-shapes', metavar='PATH', help='record query shapes for indexes.py audit')
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    if args.query_shapes and args.in_memory:
+        parser.error('--query-shapes needs a real server; mongomock publishes no command events')
+    if args.db == 'udyambharat':
+        parser.error('refusing to seed the application database')
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.startup:
+        # Exit 1 if an SDK is imported at startup again
+        sys.exit(0 if run_startup(args.runs) else 1)
+
+    counter = CommandCounter()
+    app = create_benchmark_app(args, counter)
+    rng = random.Random(args.seed)
+
+    from database import get_db
+    with app.app_context():
+        products = seed(get_db(), args, rng)
+
+    results = {}
+    for name in args.scenarios or SCENARIOS:
+        if name == 'login':
+            for rounds in args.bcrypt_rounds:
+                with app.app_context():
+                    set_bcrypt_rounds(app, get_db(), rounds)
+                print(f'Running login with bcrypt cost {rounds}...')
+                results[f'login@{rounds}'] = run_scenario(app, name, args, counter, products)
+            continue
+        print(f'Running {name}...')
+        results[name] = run_scenario(app, name, args, counter, products)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({'settings': settings(args), 'scenarios': results}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'Saved baseline to {args.baseline}')
+
+    if args.compare:
+        if baseline is None:
+            sys.exit(f'No baseline at {args.baseline}; run with --save-baseline first')
+        if baseline.get('settings') != settings(args):
+            sys.exit('The baseline was recorded with different settings; results are not comparable')
+        # mongomock timings are too noisy to compare
+        if args.in_memory:
+            print('In-memory run: comparing round trips and errors only')
+        regressions = compare(results, baseline, timings=not args.in_memory)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against the baseline')
+
+
+if __name__ == '__main__':
+    main()
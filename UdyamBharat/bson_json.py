@@ -0,0 +1,85 @@
+from datetime import date, datetime, timedelta
+from bson import Decimal128, ObjectId
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON for MongoDB documents. The app's JSON provider encodes ObjectId as
+# its hex string, datetime as ISO 8601 (naive values are UTC, so they get
+# a Z) and Decimal128 as a decimal string, so views can pass documents
+# from pymongo straight to jsonify() without copying them first. With
+# JSON_BACKEND = 'orjson' and orjson installed, encoding and decoding go
+# through orjson; the output is the same apart from whitespace.
+#
+# stream_array() writes a JSON array from a cursor a batch at a time, for
+# responses too large to build in memory.
+
+STREAM_BATCH_SIZE = 100
+
+
+def default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is None or value.utcoffset() == timedelta(0):
+            return value.replace(tzinfo=None).isoformat() + 'Z'
+        return value.isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    return DefaultJSONProvider.default(value)
+
+
+class BSONJSONProvider(DefaultJSONProvider):
+    default = staticmethod(default)
+
+
+class OrjsonProvider(BSONJSONProvider):
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def stream_array(app, cursor, batch_size=STREAM_BATCH_SIZE):
+    # Response whose body is a JSON array of the cursor's documents. The
+    # cursor fetches batch_size documents per round trip and each batch
+    # is written out before the next is read.
+    dumps = app.json.dumps
+    cursor.batch_size(batch_size)
+
+    def generate():
+        try:
+            yield '['
+            separator = ''
+            batch = []
+            for doc in cursor:
+                batch.append(dumps(doc))
+                if len(batch) == batch_size:
+                    yield separator + ','.join(batch)
+                    separator = ','
+                    batch = []
+            if batch:
+                yield separator + ','.join(batch)
+            yield ']'
+        finally:
+            cursor.close()
+
+    return app.response_class(generate(), mimetype='application/json')
+
+
+def init_app(app):
+    if app.config['JSON_BACKEND'] == 'orjson' and orjson is not None:
+        app.json = OrjsonProvider(app)
+    else:
+        app.json = BSONJSONProvider(app)
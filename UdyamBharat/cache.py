@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import sqlite3
+import stat
+import threading
+import time
+from collections import OrderedDict
+from bson import json_util
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+# Read-through caches for data that changes far less often than it is
+# read. Two backends share one interface:
+#
+#   LRUCache     in-process, bounded, per worker
+#   SQLiteCache  one file shared by every worker on the host
+#
+# SQLiteCache stores values as Extended JSON (so ObjectIds and datetimes
+# round-trip; tuples come back as lists), never pickle: whoever can write
+# the file can only plant data, not code. It needs an explicit path in a
+# directory the app owns, and refuses a file another user owns or can
+# write.
+#
+# Keys are "<namespace>:<digest of the query shape>" so a whole namespace
+# can be dropped with delete_prefix() when the underlying data changes.
+
+MISSING = object()
+
+_JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS.with_options(tz_aware=False, tzinfo=None)
+
+# Every cached listing, search and detail response lives under this
+# prefix and is dropped whenever a product is created, updated or deleted
+PRODUCTS_CACHE_PREFIX = 'products:'
+
+
+class BaseCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0, 'invalidations': 0}
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats['backend'] = type(self).__name__
+        stats['max_entries'] = self.max_entries
+        stats['ttl'] = self.ttl
+        return stats
+
+    def get_or_set(self, key, loader, ttl=None):
+        value = self.get(key)
+        if value is MISSING:
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+
+class NullCache(BaseCache):
+    # Used when caching is disabled; every lookup is a miss
+    def get(self, key):
+        self._count('misses')
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def delete_prefix(self, prefix):
+        self._count('invalidations')
+
+    def clear(self):
+        pass
+
+
+class LRUCache(BaseCache):
+    def __init__(self, max_entries=1024, ttl=60):
+        super().__init__(max_entries, ttl)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self._count('hits')
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+        self._count('misses')
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl if ttl is not None else self.ttl)
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        self._count('sets')
+        if evicted:
+            self._count('evictions', evicted)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+        self._count('invalidations')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _check_private(path):
+    # Creates path readable and writable by this user only, or checks that
+    # an existing file is
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        info = os.fstat(fd)
+    finally:
+        os.close(fd)
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        raise ValueError(f'Cache file {path} is owned by another user')
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise ValueError(f'Cache file {path} is writable by other users')
+
+
+class SQLiteCache(BaseCache):
+    # Stand-in for a network cache such as Redis: every gunicorn worker on
+    # the host opens the same database file, so an entry written by one
+    # worker is a hit in the others and invalidation reaches all of them.
+    def __init__(self, path, max_entries=4096, ttl=60):
+        super().__init__(max_entries, ttl)
+        self.path = path
+        self._local = threading.local()
+        _check_private(path)
+        with self._connection() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value TEXT, expires_at REAL, accessed_at REAL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)')
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        now = time.time()
+        with self._connection() as conn:
+            row = conn.execute('SELECT value, expires_at FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is not None and row[1] > now:
+                try:
+                    value = json_util.loads(row[0], json_options=_JSON_OPTIONS)
+                except (TypeError, ValueError):
+                    # Not written by this version; treat it as a miss
+                    value = MISSING
+                if value is not MISSING:
+                    conn.execute('UPDATE cache SET accessed_at = ? WHERE key = ?', (now, key))
+                    self._count('hits')
+                    return value
+            if row is not None:
+                conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+        self._count('misses')
+        return MISSING
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.ttl)
+        encoded = json_util.dumps(value, json_options=_JSON_OPTIONS)
+        with self._connection() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)',
+                (key, encoded, expires_at, now)
+            )
+            excess = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.max_entries
+            if excess > 0:
+                # Expired entries go first, then the least recently used
+                conn.execute(
+                    'DELETE FROM cache WHERE key IN ('
+                    'SELECT key FROM cache ORDER BY expires_at > ?, accessed_at LIMIT ?)',
+                    (now, excess)
+                )
+                self._count('evictions', excess)
+        self._count('sets')
+
+    def delete(self, key):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def delete_prefix(self, prefix):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM cache WHERE substr(key, 1, ?) = ?', (len(prefix), prefix))
+        self._count('invalidations')
+
+    def clear(self):
+        with self._connection() as conn:
+            conn.execute('DELETE FROM cache')
+
+
+def make_key(namespace, **params):
+    # One key per query shape; None values are dropped so that a missing
+    # argument and an explicit empty one share an entry
+    shape = json.dumps({k: v for k, v in params.items() if v is not None}, sort_keys=True, default=str)
+    return f'{namespace}:{hashlib.sha1(shape.encode("utf-8")).hexdigest()}'
+
+
+def create_cache(backend='lru', max_entries=1024, ttl=60, path=None, name='cache'):
+    if backend == 'none':
+        return NullCache(max_entries, ttl)
+    if backend == 'sqlite':
+        if not path:
+            raise ValueError(f'The sqlite {name} cache needs a path in a directory the app owns')
+        return SQLiteCache(path, max_entries, ttl)
+    if backend == 'lru':
+        return LRUCache(max_entries, ttl)
+    raise ValueError(f'Unknown cache backend: {backend}')
+
+
+def init_app(app):
+    app.extensions['catalog_cache'] = create_cache(
+        app.config['CACHE_BACKEND'],
+        app.config['CACHE_MAX_ENTRIES'],
+        app.config['CACHE_TTL'],
+        app.config['CACHE_PATH'],
+        name='catalog'
+    )
+
+
+# Products, search results and featured videos. Product mutations in
+# api.py drop the products namespace; videos only expire.
+catalog_cache = LocalProxy(lambda: current_app.extensions['catalog_cache'])
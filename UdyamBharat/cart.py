@@ -0,0 +1,136 @@
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from refs import ref
+
+# One cart document per buyer:
+#   {buyer_id, items: [{product_id, quantity, added_at}], updated_at}
+# Every change is a single update that the server applies atomically, so
+# concurrent requests for the same buyer cannot overwrite each other's
+# items the way a read-modify-write in Python would:
+#   add_item       pipeline update with upsert: adds to the quantity of an
+#                  existing line or appends a new one
+#   set_quantity   $set through arrayFilters
+#   remove_item    $pull
+#   remove_ordered pipeline update subtracting what checkout ordered, so
+#                  items added while checkout ran are kept
+# get_items() joins each line to its product with $lookup in the same
+# aggregate, so reading the cart is one query.
+
+PRODUCT_FIELDS = ('name', 'price', 'image_url', 'images')
+
+
+def _line_update(match_product, on_match, on_new):
+    items = {'$ifNull': ['$items', []]}
+    return {'$cond': [
+        {'$in': [match_product, {'$map': {'input': items, 'as': 'item', 'in': '$$item.product_id'}}]},
+        {'$map': {'input': items, 'as': 'item', 'in': {'$cond': [
+            {'$eq': ['$$item.product_id', match_product]},
+            on_match,
+            '$$item'
+        ]}}},
+        {'$concatArrays': [items, [on_new]]}
+    ]}
+
+
+def add_item(db, buyer_id, product_id, quantity):
+    buyer_id, product_id = ref(buyer_id), ref(product_id)
+    now = datetime.utcnow()
+    items = _line_update(
+        product_id,
+        {
+            'product_id': '$$item.product_id',
+            'quantity': {'$add': ['$$item.quantity', quantity]},
+            'added_at': '$$item.added_at'
+        },
+        {'product_id': product_id, 'quantity': quantity, 'added_at': now}
+    )
+    update = [{'$set': {'items': items, 'updated_at': now}}]
+    try:
+        db.cart.update_one({'buyer_id': buyer_id}, update, upsert=True)
+    except DuplicateKeyError:
+        # Two first adds raced to create the cart; the loser's update now
+        # finds the document
+        db.cart.update_one({'buyer_id': buyer_id}, update)
+
+
+def set_quantity(db, buyer_id, product_id, quantity):
+    # Returns False if the product is not in the cart
+    if quantity <= 0:
+        return remove_item(db, buyer_id, product_id)
+    result = db.cart.update_one(
+        {'buyer_id': ref(buyer_id), 'items.product_id': ref(product_id)},
+        {'$set': {'items.$[item].quantity': quantity, 'updated_at': datetime.utcnow()}},
+        array_filters=[{'item.product_id': ref(product_id)}]
+    )
+    return result.matched_count > 0
+
+
+def remove_item(db, buyer_id, product_id):
+    # Returns False if the product is not in the cart
+    result = db.cart.update_one(
+        {'buyer_id': ref(buyer_id), 'items.product_id': ref(product_id)},
+        {'$pull': {'items': {'product_id': ref(product_id)}}, '$set': {'updated_at': datetime.utcnow()}}
+    )
+    return result.modified_count > 0
+
+
+def get_cart(db, buyer_id, session=None):
+    return db.cart.find_one({'buyer_id': ref(buyer_id)}, session=session)
+
+
+def remove_ordered(db, buyer_id, items, session=None):
+    # items: the cart lines checkout read; their quantities are subtracted
+    # and lines that reach zero are dropped
+    ordered = [
+        {'case': {'$eq': ['$$item.product_id', item['product_id']]}, 'then': item['quantity']}
+        for item in items
+    ]
+    if not ordered:
+        return
+    remaining = {'$map': {'input': '$items', 'as': 'item', 'in': {
+        'product_id': '$$item.product_id',
+        'quantity': {'$subtract': ['$$item.quantity', {'$switch': {'branches': ordered, 'default': 0}}]},
+        'added_at': '$$item.added_at'
+    }}}
+    db.cart.update_one(
+        {'buyer_id': ref(buyer_id)},
+        [{'$set': {
+            'items': {'$filter': {'input': remaining, 'as': 'item', 'cond': {'$gt': ['$$item.quantity', 0]}}},
+            'updated_at': datetime.utcnow()
+        }}],
+        session=session
+    )
+
+
+def get_items(db, buyer_id):
+    # Cart lines with their product's name, price and images; lines whose
+    # product has been deleted are left out
+    return list(db.cart.aggregate([
+        {'$match': {'buyer_id': ref(buyer_id)}},
+        {'$unwind': '$items'},
+        {'$lookup': {
+            'from': 'products',
+            'localField': 'items.product_id',
+            'foreignField': '_id',
+            'as': 'product'
+        }},
+        {'$unwind': '$product'},
+        {'$project': {
+            '_id': 0,
+            'product_id': '$items.product_id',
+            'quantity': '$items.quantity',
+            'added_at': '$items.added_at',
+            'product': {field: f'$product.{field}' for field in PRODUCT_FIELDS}
+        }}
+    ]))
+
+
+def fold_line_documents(db):
+    # Earlier carts were stored as one document per line ({user_id,
+    # product_id, quantity}); fold those into the buyer's cart document
+    lines = list(db.cart.find({'user_id': {'$exists': True}}))
+    for line in lines:
+        add_item(db, line['user_id'], line['product_id'], line.get('quantity', 1))
+    if lines:
+        db.cart.delete_many({'_id': {'$in': [line['_id'] for line in lines]}})
+    return len(lines)
@@ -1,27 +1,142 @@
-from google import genai
-import os
-from dotenv import load_dotenv
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+from cache import create_cache, make_key, MISSING
+from lazy import Lazy
+from metrics import metrics
 
-# Load environment variables
-load_dotenv()
+# Gemini answers are slow and paid for per call, so:
+#   - repeated questions are answered from an exact-match TTL cache
+#   - at most CHATBOT_MAX_IN_FLIGHT calls run per process; a request that
+#     cannot get a slot within CHATBOT_ACQUIRE_TIMEOUT is turned away
+#     instead of tying up the worker
+#   - stream() yields text as the model produces it
+# The client is built on first use by client_factory, which tests and
+# benchmarks can replace with a local fake; the Gemini SDK is only
+# imported then.
+
+MODEL = "gemini-2.0-flash"
+ERROR_MESSAGE = "I'm having trouble connecting. Please try again in a moment."
+BUSY_MESSAGE = "I'm answering a lot of questions right now. Please try again in a moment."
+
+
+class ChatbotBusy(Exception):
+    pass
+
+
+def gemini_client_factory(api_key):
+    def create():
+        from google import genai
+        return genai.Client(api_key=api_key)
+    return create
+
+
+class Chatbot:
+    def __init__(self, client_factory, max_in_flight, acquire_timeout, cache):
+        self._client = Lazy(client_factory)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.acquire_timeout = acquire_timeout
+        self.cache = cache
+
+    @property
+    def client(self):
+        return self._client.get()
+
+    def _cache_key(self, message):
+        # Exact match apart from surrounding and repeated whitespace
+        return make_key('chatbot', model=MODEL, message=' '.join(message.split()))
+
+    def _acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise ChatbotBusy()
+
+    def respond(self, message):
+        key = self._cache_key(message)
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            return cached
+
+        self._acquire()
+        try:
+            with metrics.external('gemini'):
+                response = self.client.models.generate_content(model=MODEL, contents=message)
+        finally:
+            self._slots.release()
+
+        # An empty answer (for example one Gemini blocked) is not cached,
+        # so the next ask tries the model again
+        if response.text:
+            self.cache.set(key, response.text)
+        return response.text
+
+    def stream(self, message):
+        # Returns an iterator of text chunks. The slot is taken and the first
+        # chunk fetched before returning, so ChatbotBusy and connection
+        # errors surface here rather than halfway through a response.
+        key = self._cache_key(message)
+        cached = self.cache.get(key)
+        if cached is not MISSING:
+            return iter([cached])
+
+        chunks = self._generate_stream(key, message)
+        first = next(chunks, None)
+        return self._resume(first, chunks)
+
+    def _generate_stream(self, key, message):
+        self._acquire()
+        try:
+            parts = []
+            with metrics.external('gemini'):
+                for chunk in self.client.models.generate_content_stream(model=MODEL, contents=message):
+                    if chunk.text:
+                        parts.append(chunk.text)
+                        yield chunk.text
+        finally:
+            self._slots.release()
+        if parts:
+            self.cache.set(key, ''.join(parts))
+
+    def _resume(self, first, chunks):
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        finally:
+            chunks.close()
 
-# Configure Gemini API
-client = genai.Client(api_key=os.getenv('GEMINI_API_KEY'))
 
 def get_chatbot_response(user_message):
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=user_message,
-        )
-        # The response object has a .text attribute with the answer
         return {
             'success': True,
-            'message': response.text
+            'message': chatbot_service.respond(user_message)
+        }
+    except ChatbotBusy:
+        return {
+            'success': False,
+            'message': BUSY_MESSAGE
         }
     except Exception as e:
         print(f"Error in chatbot: {str(e)}")
         return {
             'success': False,
-            'message': "I'm having trouble connecting. Please try again in a moment."
-        } 
\ No newline at end of file
+            'message': ERROR_MESSAGE
+        }
+
+
+def init_app(app, client_factory=None):
+    app.extensions['chatbot'] = Chatbot(
+        client_factory or gemini_client_factory(app.config['GEMINI_API_KEY']),
+        app.config['CHATBOT_MAX_IN_FLIGHT'],
+        app.config['CHATBOT_ACQUIRE_TIMEOUT'],
+        create_cache(
+            app.config['CHATBOT_CACHE_BACKEND'],
+            app.config['CHATBOT_CACHE_MAX_ENTRIES'],
+            app.config['CHATBOT_CACHE_TTL'],
+            app.config['CHATBOT_CACHE_PATH'],
+            name='chatbot'
+        )
+    )
+
+
+chatbot_service = LocalProxy(lambda: current_app.extensions['chatbot'])
@@ -0,0 +1,164 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from lookups import products_by_id
+from notifications import notify
+from seller_stats import orders_placed
+import cart
+from refs import ref
+
+# Checkout turns a buyer's cart into orders with a fixed number of round
+# trips however many items and sellers the cart holds: one cart read, one
+# $in product fetch, one insert_many each for orders and seller
+# notifications, a bulk_write and a read for the sellers' unread counters
+# (one find_one_and_update when there is a single seller), one bulk_write
+# for seller_stats and one cart update. (Archiving a seller's oldest
+# notifications past MAX_UNREAD adds two more.) When the server supports
+# transactions (replica set or mongos) all of it commits or rolls back
+# together.
+#
+# Clients may send an idempotency key. The first request with a given key
+# claims it in the checkouts collection; a replay after that returns the
+# stored result instead of placing the orders again.
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 128
+IDEMPOTENCY_TTL_SECONDS = 24 * 60 * 60
+
+_transaction_support = {}
+
+
+class CheckoutError(Exception):
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+
+def supports_transactions(client):
+    # Standalone servers reject transactions; only ask the server once
+    key = id(client)
+    if key not in _transaction_support:
+        try:
+            info = client.admin.command('ismaster')
+            _transaction_support[key] = 'setName' in info or info.get('msg') == 'isdbgrid'
+        except OperationFailure:
+            _transaction_support[key] = False
+    return _transaction_support[key]
+
+
+def _place_orders(db, buyer_id, session=None):
+    buyer_cart = cart.get_cart(db, buyer_id, session)
+    cart_items = buyer_cart['items'] if buyer_cart else []
+    if not cart_items:
+        raise CheckoutError('Cart is empty')
+
+    products = products_by_id(db, (item['product_id'] for item in cart_items), session=session)
+
+    now = datetime.utcnow()
+    orders = []
+    notifications = []
+    for item in cart_items:
+        product = products.get(str(item['product_id']))
+        if not product:
+            continue
+
+        # Order ids are assigned here so notifications can reference them
+        # before either batch is written
+        order_id = ObjectId()
+        orders.append({
+            '_id': order_id,
+            'buyer_id': buyer_id,
+            'seller_id': product['seller_id'],
+            'product_id': item['product_id'],
+            'quantity': item['quantity'],
+            'total_price': product['price'] * item['quantity'],
+            'status': 'pending',
+            'created_at': now
+        })
+        notifications.append({
+            'user_id': product['seller_id'],
+            'message': f'New order received for {product["name"]}',
+            'type': 'order',
+            'order_id': order_id,
+            'read': False,
+            'created_at': now
+        })
+
+    if orders:
+        db.orders.insert_many(orders, session=session)
+        notify(db, notifications, session=session)
+        orders_placed(
+            db,
+            orders,
+            {str(product['_id']): product['name'] for product in products.values()},
+            session=session
+        )
+
+    # Only the quantities that were read are removed; anything added to the
+    # cart while checkout was running stays there
+    cart.remove_ordered(db, buyer_id, cart_items, session)
+
+    return {
+        'message': 'Checkout successful',
+        'order_ids': [str(order['_id']) for order in orders],
+        'total': sum(order['total_price'] for order in orders)
+    }
+
+
+def _claim_key(db, buyer_id, key):
+    # Returns the stored result if the key was already used
+    try:
+        db.checkouts.insert_one({
+            'buyer_id': buyer_id,
+            'key': key,
+            'status': 'pending',
+            'created_at': datetime.utcnow()
+        })
+        return None
+    except DuplicateKeyError:
+        existing = db.checkouts.find_one({'buyer_id': buyer_id, 'key': key})
+        if existing and existing['status'] == 'completed':
+            return existing['result']
+        if existing:
+            raise CheckoutError('Checkout already in progress', 409)
+        # The record expired between the insert and the read; claim it again
+        return _claim_key(db, buyer_id, key)
+
+
+def process_checkout(client, db, buyer_id, idempotency_key=None):
+    # Returns (result, replayed)
+    buyer_id = ref(buyer_id)
+    if idempotency_key is not None:
+        if not idempotency_key or len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+            raise CheckoutError('Invalid idempotency key')
+        stored = _claim_key(db, buyer_id, idempotency_key)
+        if stored is not None:
+            return stored, True
+
+    def run(session=None):
+        result = _place_orders(db, buyer_id, session)
+        if idempotency_key is not None:
+            db.checkouts.update_one(
+                {'buyer_id': buyer_id, 'key': idempotency_key},
+                {'$set': {'status': 'completed', 'result': result}},
+                session=session
+            )
+        return result
+
+    try:
+        if supports_transactions(client):
+            with client.start_session() as session:
+                result = session.with_transaction(run)
+        else:
+            result = run()
+    except Exception:
+        # Release the key so the client can retry the same request
+        if idempotency_key is not None:
+            db.checkouts.delete_one({
+                'buyer_id': buyer_id,
+                'key': idempotency_key,
+                'status': 'pending'
+            })
+        raise
+
+    return result, False
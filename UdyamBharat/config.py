@@ -12,6 +12,17 @@ class Config:
     # MongoDB settings
     MONGODB_URI = os.getenv('MONGODB_URI')
     MONGODB_DB = 'udyambharat'
+    MONGODB_MAX_POOL_SIZE = int(os.getenv('MONGODB_MAX_POOL_SIZE', 50))
+    MONGODB_MIN_POOL_SIZE = int(os.getenv('MONGODB_MIN_POOL_SIZE', 0))
+    MONGODB_MAX_IDLE_TIME_MS = int(os.getenv('MONGODB_MAX_IDLE_TIME_MS', 60000))
+    # Fail fast instead of queueing behind a saturated pool or waiting on an
+    # unreachable server
+    MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv('MONGODB_WAIT_QUEUE_TIMEOUT_MS', 2000))
+    MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGODB_SERVER_SELECTION_TIMEOUT_MS', 5000))
+    MONGODB_CONNECT_TIMEOUT_MS = int(os.getenv('MONGODB_CONNECT_TIMEOUT_MS', 5000))
+    MONGODB_SOCKET_TIMEOUT_MS = int(os.getenv('MONGODB_SOCKET_TIMEOUT_MS', 30000))
+    # Read preference for product and video listings; see database.READ_PREFERENCES
+    CATALOG_READ_PREFERENCE = os.getenv('CATALOG_READ_PREFERENCE', 'secondaryPreferred')
     
     # Google Cloud settings
     GOOGLE_CLOUD_PROJECT = os.getenv('GOOGLE_CLOUD_PROJECT')
@@ -21,6 +32,41 @@ class Config:
     UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/uploads')
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+    # Longest edge in pixels for each derivative of a product photo
+    IMAGE_SIZES = {'thumb': 160, 'card': 480, 'detail': 1200}
+    IMAGE_QUALITY = 82
+    IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+    
+    # Static assets built by `python assets.py` are fingerprinted, so they
+    # can be cached for a year
+    ASSET_MAX_AGE = 365 * 24 * 3600  # seconds
+    ASSET_ETAG_CACHE_MAX_ENTRIES = 4096
+    
+    # Voice transcription jobs: worker threads per process, jobs allowed to
+    # wait behind them, and how much audio is buffered in memory before
+    # spilling to an anonymous temp file
+    TRANSCRIPTION_WORKERS = int(os.getenv('TRANSCRIPTION_WORKERS', 4))
+    TRANSCRIPTION_MAX_QUEUE = int(os.getenv('TRANSCRIPTION_MAX_QUEUE', 16))
+    TRANSCRIPTION_SPOOL_MAX_BYTES = 2 * 1024 * 1024
+    
+    # Bulk product import: jobs run per process and allowed to wait behind
+    # them, products per insert_many, and size limits. The upload holds
+    # every photo, so it has its own request size limit.
+    IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', 1))
+    IMPORT_MAX_QUEUE = int(os.getenv('IMPORT_MAX_QUEUE', 4))
+    IMPORT_BATCH_SIZE = 500
+    IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 10000))
+    IMPORT_MAX_CONTENT_LENGTH = int(os.getenv('IMPORT_MAX_CONTENT_LENGTH', 2 * 1024 * 1024 * 1024))
+    IMPORT_MAX_IMAGE_BYTES = 16 * 1024 * 1024
+    IMPORT_SPOOL_MAX_BYTES = 2 * 1024 * 1024
+    
+    # Password hashing: the bcrypt cost factor (each step doubles the time;
+    # stored hashes are moved to it as users log in), hashing threads per
+    # process, and how many logins and registrations may wait for one
+    # before new ones are turned away
+    BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 16))
     
     # Supported languages for voice input
     SUPPORTED_LANGUAGES = {
@@ -31,6 +77,16 @@ class Config:
     
     # Notification settings
     NOTIFICATION_AUDIO_FOLDER = os.path.join('static', 'audio')
+    # How open dashboards keep the unread badge current: 'poll' reads
+    # /api/notifications/unread_count every NOTIFICATION_POLL_INTERVAL
+    # seconds; 'events' holds a server-sent event stream open, which ties
+    # up a worker thread per open page, so only use it with a threaded or
+    # gevent worker class (see README)
+    NOTIFICATION_UPDATES = os.getenv('NOTIFICATION_UPDATES', 'poll')
+    NOTIFICATION_POLL_INTERVAL = int(os.getenv('NOTIFICATION_POLL_INTERVAL', 30))  # seconds
+    # Synthesized speech, stored by content hash and served as static files
+    TTS_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static/audio/tts')
+    TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', 200 * 1024 * 1024))
     
     # Email configuration
     MAIL_SERVER = os.getenv('MAIL_SERVER')
@@ -42,6 +98,16 @@ class Config:
     # API Keys
     ASSEMBLYAI_API_KEY = os.getenv('ASSEMBLYAI_API_KEY')
     ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
+    GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
+
+    # Chatbot: concurrent Gemini calls per process, how long a request may
+    # wait for one, and the exact-match answer cache
+    CHATBOT_MAX_IN_FLIGHT = int(os.getenv('CHATBOT_MAX_IN_FLIGHT', 4))
+    CHATBOT_ACQUIRE_TIMEOUT = float(os.getenv('CHATBOT_ACQUIRE_TIMEOUT', 2))  # seconds
+    CHATBOT_CACHE_BACKEND = os.getenv('CHATBOT_CACHE_BACKEND', 'lru')
+    CHATBOT_CACHE_MAX_ENTRIES = int(os.getenv('CHATBOT_CACHE_MAX_ENTRIES', 512))
+    CHATBOT_CACHE_TTL = int(os.getenv('CHATBOT_CACHE_TTL', 3600))  # seconds
+    CHATBOT_CACHE_PATH = os.getenv('CHATBOT_CACHE_PATH')
     
     # Security
     SESSION_COOKIE_SECURE = True
@@ -52,7 +118,40 @@ class Config:
     # Rate limiting
     RATELIMIT_DEFAULT = "200 per day;50 per hour;1 per second"
     RATELIMIT_STORAGE_URL = os.getenv('REDIS_URL', 'memory://')
-    
+
+    # JSON responses: 'orjson' (falls back to the standard library if it is
+    # not installed) or 'json'
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'orjson')
+
+    # Catalog cache: 'lru' (per worker), 'sqlite' (shared by all workers on
+    # the host) or 'none'. 'sqlite' needs CACHE_PATH (USER_CACHE_PATH,
+    # CHATBOT_CACHE_PATH for the others) in a directory only the app can
+    # write to.
+    CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'lru')
+    CACHE_MAX_ENTRIES = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+    CACHE_TTL = int(os.getenv('CACHE_TTL', 60))  # seconds
+    CACHE_PATH = os.getenv('CACHE_PATH')
+
+    # Logged-in user records for Flask-Login. With the per-worker 'lru'
+    # backend an invalidation only reaches the worker that made it, so the
+    # TTL bounds how long other workers can see a stale role or name.
+    USER_CACHE_BACKEND = os.getenv('USER_CACHE_BACKEND', 'lru')
+    USER_CACHE_MAX_ENTRIES = int(os.getenv('USER_CACHE_MAX_ENTRIES', 10000))
+    USER_CACHE_TTL = int(os.getenv('USER_CACHE_TTL', 300))  # seconds
+    USER_CACHE_PATH = os.getenv('USER_CACHE_PATH')
+
+    # /metrics: requests making more than QUERY_BUDGET MongoDB commands are
+    # logged (0 turns this off), requests slower than SLOW_REQUEST_SECONDS
+    # are kept as samples, and METRICS_TOKEN, if set, must be sent as a
+    # bearer token
+    QUERY_BUDGET = int(os.getenv('QUERY_BUDGET', 25))
+    SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 1))
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+    # File to record the shape of each MongoDB query made by a request
+    # in, for `python indexes.py audit`; off unless set
+    QUERY_SHAPES_LOG = os.getenv('QUERY_SHAPES_LOG')
+
     @staticmethod
     def init_app(app):
         # Create required directories
@@ -66,11 +165,19 @@ class Config:
 class DevelopmentConfig(Config):
     DEBUG = True
     TESTING = False
+    # The development server runs over plain HTTP
+    SESSION_COOKIE_SECURE = False
 
 class TestingConfig(Config):
     TESTING = True
     DEBUG = True
-    MONGODB_URI = 'mongodb local host address for testing'
+    MONGODB_URI = os.getenv('TEST_MONGODB_URI', 'mongodb://localhost:27017')
+    MONGODB_DB = 'udyambharat_test'
+    SESSION_COOKIE_SECURE = False
+    CACHE_BACKEND = 'none'
+    USER_CACHE_BACKEND = 'none'
+    CHATBOT_CACHE_BACKEND = 'none'
+    BCRYPT_ROUNDS = 4
 
 class ProductionConfig(Config):
     DEBUG = False
@@ -0,0 +1,96 @@
+import os
+import threading
+from flask import current_app
+from pymongo import MongoClient, ReadPreference
+from werkzeug.local import LocalProxy
+
+# The one place the application talks to MongoDB. create_app() calls
+# init_app(), and blueprints import the `db`, `catalog_db` and `client`
+# proxies below, which resolve to the current app's handles. The client
+# is created on first use in each process, so gunicorn workers never
+# share a pool inherited across fork(). init_app() takes an optional
+# client_factory(config) in place of create_client, which is how the
+# benchmark counts commands or runs against an in-memory stand-in.
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST
+}
+
+
+def client_options(config):
+    return {
+        'maxPoolSize': config['MONGODB_MAX_POOL_SIZE'],
+        'minPoolSize': config['MONGODB_MIN_POOL_SIZE'],
+        'maxIdleTimeMS': config['MONGODB_MAX_IDLE_TIME_MS'],
+        'waitQueueTimeoutMS': config['MONGODB_WAIT_QUEUE_TIMEOUT_MS'],
+        'serverSelectionTimeoutMS': config['MONGODB_SERVER_SELECTION_TIMEOUT_MS'],
+        'connectTimeoutMS': config['MONGODB_CONNECT_TIMEOUT_MS'],
+        'socketTimeoutMS': config['MONGODB_SOCKET_TIMEOUT_MS'],
+        'appname': 'udyambharat',
+        # metrics.init_app() adds its command listener here
+        'event_listeners': list(config.get('MONGODB_EVENT_LISTENERS', []))
+    }
+
+
+def create_client(config):
+    return MongoClient(config['MONGODB_URI'], **client_options(config))
+
+
+class Mongo:
+    def __init__(self, config, client_factory=create_client):
+        self.config = config
+        self.client_factory = client_factory
+        self._lock = threading.Lock()
+        self._client = None
+        self._pid = None
+
+    @property
+    def client(self):
+        if self._client is None or self._pid != os.getpid():
+            with self._lock:
+                if self._client is None or self._pid != os.getpid():
+                    self._client = self.client_factory(self.config)
+                    self._pid = os.getpid()
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.config['MONGODB_DB']]
+
+    @property
+    def catalog_db(self):
+        # Product and video listings tolerate slightly stale reads, so they
+        # may be served by secondaries
+        read_preference = READ_PREFERENCES[self.config['CATALOG_READ_PREFERENCE']]
+        return self.client.get_database(self.config['MONGODB_DB'], read_preference=read_preference)
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+
+
+def init_app(app, client_factory=None):
+    app.extensions['mongo'] = Mongo(app.config, client_factory or create_client)
+
+
+def get_client():
+    return current_app.extensions['mongo'].client
+
+
+def get_db():
+    return current_app.extensions['mongo'].db
+
+
+def get_catalog_db():
+    return current_app.extensions['mongo'].catalog_db
+
+
+client = LocalProxy(get_client)
+db = LocalProxy(get_db)
+catalog_db = LocalProxy(get_catalog_db)
@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timedelta
+from cache import LRUCache, MISSING
+from lookups import products_by_id
+from refs import ref
+
+# Order export for sellers, written as it is read so memory use does not
+# grow with the number of orders:
+#   - orders come from one cursor with a projection, EXPORT_BATCH_SIZE
+#     documents per round trip
+#   - product names are joined one batch at a time with a single $in for
+#     the products not already in a bounded LRU cache
+#   - rows are encoded as CSV or NDJSON and, if the client accepts it,
+#     gzipped on the fly
+# At any moment only one batch of orders, the name cache and the
+# compressor's window are held.
+
+EXPORT_BATCH_SIZE = 1000
+PRODUCT_NAME_CACHE_MAX_ENTRIES = 10000
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson'
+}
+COLUMNS = ('order_id', 'created_at', 'product_id', 'product_name', 'quantity', 'total_price', 'status', 'buyer_id')
+ORDER_PROJECTION = {
+    'created_at': 1,
+    'product_id': 1,
+    'quantity': 1,
+    'total_price': 1,
+    'status': 1,
+    'buyer_id': 1
+}
+
+
+def parse_date(raw):
+    # 'YYYY-MM-DD' or None; raises ValueError otherwise
+    if not raw:
+        return None
+    return datetime.strptime(raw, '%Y-%m-%d')
+
+
+def _timestamp(value):
+    return value.isoformat() + 'Z' if value else ''
+
+
+def _named_rows(db, orders, names):
+    product_ids = {str(order.get('product_id')) for order in orders}
+    batch_names = {}
+    for product_id in product_ids:
+        name = names.get(product_id)
+        if name is not MISSING:
+            batch_names[product_id] = name
+
+    missing = product_ids - batch_names.keys()
+    if missing:
+        products = products_by_id(db, missing, ['name'])
+        for product_id in missing:
+            # Deleted products export with an empty name
+            name = products.get(product_id, {}).get('name', '')
+            names.set(product_id, name)
+            batch_names[product_id] = name
+
+    for order in orders:
+        product_id = str(order.get('product_id'))
+        yield {
+            'order_id': str(order['_id']),
+            'created_at': _timestamp(order.get('created_at')),
+            'product_id': product_id,
+            'product_name': batch_names[product_id],
+            'quantity': order.get('quantity'),
+            'total_price': order.get('total_price', 0),
+            'status': order.get('status'),
+            'buyer_id': str(order.get('buyer_id'))
+        }
+
+
+def order_rows(db, seller_id, start=None, end=None, batch_size=EXPORT_BATCH_SIZE,
+               cache_entries=PRODUCT_NAME_CACHE_MAX_ENTRIES):
+    # Yields lists of row dicts, oldest order first. end is inclusive: every
+    # order placed on that day is exported.
+    query = {'seller_id': ref(seller_id)}
+    created_at = {}
+    if start:
+        created_at['$gte'] = start
+    if end:
+        created_at['$lt'] = end + timedelta(days=1)
+    if created_at:
+        query['created_at'] = created_at
+
+    # The export only needs names for the life of one request
+    names = LRUCache(cache_entries, ttl=24 * 60 * 60)
+    cursor = db.orders.find(query, ORDER_PROJECTION).sort('created_at', 1).batch_size(batch_size)
+    try:
+        batch = []
+        for order in cursor:
+            batch.append(order)
+            if len(batch) == batch_size:
+                yield list(_named_rows(db, batch, names))
+                batch = []
+        if batch:
+            yield list(_named_rows(db, batch, names))
+    finally:
+        cursor.close()
+
+
+def encode_csv(batches):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=COLUMNS)
+    writer.writeheader()
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def encode_ndjson(batches):
+    for rows in batches:
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+
+ENCODERS = {
+    'csv': encode_csv,
+    'ndjson': encode_ndjson
+}
+
+
+def gzip_stream(chunks):
+    # gzip container (wbits=31) so it can be sent as Content-Encoding: gzip
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_orders(db, seller_id, format, start=None, end=None, gzip=True):
+    # Iterator of bytes for the response body
+    chunks = ENCODERS[format](order_rows(db, seller_id, start, end))
+    if gzip:
+        return gzip_stream(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
@@ -0,0 +1,170 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from flask import current_app
+from PIL import Image, ImageOps
+from werkzeug.local import LocalProxy
+from cache import PRODUCTS_CACHE_PREFIX, catalog_cache
+from database import db
+
+# Product photos are stored by the SHA-256 of the uploaded bytes, so the
+# same photo uploaded twice is stored and processed once. Each upload is
+# re-encoded into thumb/card/detail sizes in WebP and JPEG; re-encoding
+# drops EXIF (including GPS) after applying its orientation. The original
+# upload is not kept.
+#
+# Rendering runs in a process pool so the request only hashes and
+# validates the bytes. Derivative URLs follow from the hash, so they are
+# stored on the product straight away with image_status 'processing',
+# which becomes 'ready' or 'failed' when rendering finishes.
+
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg')
+}
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def _filename(digest, size, fmt):
+    return f'{digest}-{size}.{FORMATS[fmt][1]}'
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; composite transparent images onto white
+    if image.mode in ('RGBA', 'LA'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def render_derivatives(data, digest, folder, sizes, quality):
+    # Runs in a worker process, so it only takes and returns plain values
+    with Image.open(io.BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode == 'P':
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGB')
+
+        for size, edge in sizes.items():
+            variant = image.copy()
+            variant.thumbnail((edge, edge), Image.LANCZOS)
+            for fmt, (pil_format, _) in FORMATS.items():
+                output = variant if fmt == 'webp' else _flatten(variant)
+                path = os.path.join(folder, _filename(digest, size, fmt))
+                fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+                try:
+                    with os.fdopen(fd, 'wb') as f:
+                        output.save(f, pil_format, quality=quality, optimize=True)
+                    os.replace(tmp_path, path)
+                except Exception:
+                    os.remove(tmp_path)
+                    raise
+    return digest
+
+
+class ImagePipeline:
+    def __init__(self, app):
+        self.app = app
+        self.folder = app.config['UPLOAD_FOLDER']
+        self.url_prefix = '/static/' + os.path.relpath(self.folder, app.static_folder).replace(os.sep, '/')
+        self.sizes = app.config['IMAGE_SIZES']
+        self.quality = app.config['IMAGE_QUALITY']
+        self.workers = app.config['IMAGE_WORKERS']
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    @property
+    def executor(self):
+        # Started on first upload; 'spawn' keeps the workers free of the
+        # parent's MongoDB client and threads
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context('spawn')
+                    )
+        return self._executor
+
+    def urls(self, digest):
+        return {
+            size: {fmt: f'{self.url_prefix}/{_filename(digest, size, fmt)}' for fmt in FORMATS}
+            for size in self.sizes
+        }
+
+    def _paths(self, digest):
+        return [os.path.join(self.folder, _filename(digest, size, fmt)) for size in self.sizes for fmt in FORMATS]
+
+    def submit(self, data):
+        # Returns (digest, urls, future); future is None when the derivatives
+        # already exist. Raises InvalidImage for anything Pillow cannot read.
+        try:
+            with Image.open(io.BytesIO(data)) as probe:
+                probe.verify()
+        except Exception as e:
+            raise InvalidImage(str(e)) from e
+
+        digest = hashlib.sha256(data).hexdigest()
+        submitted = False
+        with self._lock:
+            future = self._pending.get(digest)
+            if future is None and not all(os.path.exists(path) for path in self._paths(digest)):
+                os.makedirs(self.folder, exist_ok=True)
+                future = self.executor.submit(
+                    render_derivatives, data, digest, self.folder, self.sizes, self.quality
+                )
+                self._pending[digest] = future
+                submitted = True
+        if submitted:
+            # Outside the lock: a future that has already finished runs the
+            # callback, which takes the lock, straight away on this thread
+            future.add_done_callback(lambda _: self._forget(digest))
+        return digest, self.urls(digest), future
+
+    def _forget(self, digest):
+        with self._lock:
+            self._pending.pop(digest, None)
+
+    def mark_when_done(self, digest, future):
+        # Call after the product documents referencing digest are written
+        future.add_done_callback(lambda f: self._mark(digest, f))
+
+    def _mark(self, digest, future):
+        status = 'failed' if future.exception() else 'ready'
+        if future.exception():
+            print(f"Image processing error: {str(future.exception())}")
+        with self.app.app_context():
+            db.products.update_many(
+                {'image_hash': digest, 'image_status': 'processing'},
+                {'$set': {'image_status': status}}
+            )
+            catalog_cache.delete_prefix(PRODUCTS_CACHE_PREFIX)
+
+    def remove(self, digest):
+        for path in self._paths(digest):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+
+
+def init_app(app):
+    app.extensions['images'] = ImagePipeline(app)
+
+
+image_pipeline = LocalProxy(lambda: current_app.extensions['images'])
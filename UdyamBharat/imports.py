@@ -0,0 +1,253 @@
+import csv
+import io
+import math
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from datetime import datetime
+from bson import ObjectId
+from flask import Request, current_app
+from pymongo.errors import BulkWriteError
+from werkzeug.local import LocalProxy
+from cache import PRODUCTS_CACHE_PREFIX, catalog_cache
+from database import db
+from images import InvalidImage
+from job_queue import TERMINAL_STATUSES, JobQueue
+from refs import normalize, ref
+import seller_stats
+
+# Bulk product import from a CSV plus a zip of the photos it names. Like
+# transcription, it runs as a job (see job_queue.py): the request only
+# spools the two files and returns a job id, and a per-process thread pool
+# does the work, with progress and per-row errors in the imports
+# collection for any worker to report.
+#
+# The CSV is read one row at a time. Valid rows are written with one
+# insert_many per IMPORT_BATCH_SIZE products, and each photo goes through
+# the image pipeline's process pool, as for a single upload. At most a few
+# photos per render worker are read from the archive ahead of rendering,
+# so memory use does not depend on the size of the import.
+#
+# CSV columns (header row required, any order): name, description, price,
+# district, category, image. image is the photo's file name in the zip;
+# folders inside the zip are ignored.
+
+REQUIRED_COLUMNS = ('name', 'price', 'image')
+MAX_NAME_LENGTH = 200
+# Per-row errors stored on the job; any beyond this are only counted
+MAX_ERRORS = 100
+
+
+class ImportBusy(Exception):
+    pass
+
+
+class InvalidArchive(Exception):
+    pass
+
+
+class ImportRequest(Request):
+    # An import carries every photo at once, far more than
+    # MAX_CONTENT_LENGTH allows for other requests
+    @property
+    def max_content_length(self):
+        if self.endpoint == 'api.import_products':
+            return current_app.config['IMPORT_MAX_CONTENT_LENGTH']
+        return super().max_content_length
+
+
+def parse_row(row):
+    # Returns (product fields, image file name); raises ValueError with a
+    # message for the seller
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise ValueError('name is required')
+    if len(name) > MAX_NAME_LENGTH:
+        raise ValueError(f'name is longer than {MAX_NAME_LENGTH} characters')
+    try:
+        price = float(row.get('price') or '')
+    except ValueError:
+        raise ValueError('price must be a number')
+    if not math.isfinite(price) or price <= 0:
+        raise ValueError('price must be greater than 0')
+    image = (row.get('image') or '').strip()
+    if not image:
+        raise ValueError('image is required')
+
+    product = {
+        'name': name,
+        'description': (row.get('description') or '').strip(),
+        'price': price,
+        'district': (row.get('district') or '').strip(),
+        'category': (row.get('category') or '').strip()
+    }
+    return product, image
+
+
+class ProductImporter:
+    def __init__(self, app):
+        self.app = app
+        self.batch_size = app.config['IMPORT_BATCH_SIZE']
+        self.max_rows = app.config['IMPORT_MAX_ROWS']
+        self.max_image_bytes = app.config['IMPORT_MAX_IMAGE_BYTES']
+        # Photos handed to the image pipeline and not yet rendered
+        self.max_pending_images = 2 * app.config['IMAGE_WORKERS']
+        self._jobs = JobQueue(
+            app,
+            'import',
+            'imports',
+            app.config['IMPORT_WORKERS'],
+            app.config['IMPORT_MAX_QUEUE'],
+            app.config['IMPORT_SPOOL_MAX_BYTES'],
+            ImportBusy
+        )
+
+    def submit(self, csv_stream, archive_stream, seller_id, seller_name):
+        # Raises ImportBusy when too many imports are running or waiting,
+        # and InvalidArchive unless archive_stream is a zip file
+        def check(csv_file, archive):
+            if not zipfile.is_zipfile(archive):
+                raise InvalidArchive('Images must be uploaded as a zip file')
+            archive.seek(0)
+
+        def run(job_id, csv_file, archive):
+            return self._import(job_id, csv_file, archive, seller_id, seller_name)
+
+        job = {
+            'seller_id': ref(seller_id),
+            'total': None,
+            'processed': 0,
+            'imported': 0,
+            'failed': 0,
+            'errors': []
+        }
+        return self._jobs.submit([csv_stream, archive_stream], job, run, check)
+
+    def _import(self, job_id, csv_file, archive, seller_id, seller_name):
+        text = io.TextIOWrapper(csv_file, encoding='utf-8-sig', newline='')
+        try:
+            # Counting rows first lets the job report how far along it is
+            total = max(sum(1 for _ in csv.reader(text)) - 1, 0)
+            text.seek(0)
+            reader = csv.DictReader(text)
+            reader.fieldnames = [(name or '').strip().lower() for name in reader.fieldnames or []]
+            missing = [column for column in REQUIRED_COLUMNS if column not in reader.fieldnames]
+            if missing:
+                raise ValueError(f"CSV is missing columns: {', '.join(missing)}")
+            if total > self.max_rows:
+                raise ValueError(f'CSV has {total} rows; at most {self.max_rows} can be imported at once')
+            self._jobs.update(job_id, {'total': total})
+
+            progress = {'processed': 0, 'imported': 0, 'failed': 0, 'errors': []}
+            with zipfile.ZipFile(archive) as zf:
+                members = {os.path.basename(info.filename): info for info in zf.infolist() if not info.is_dir()}
+                batch = []
+                pending = set()
+                for row in reader:
+                    line = reader.line_num
+                    progress['processed'] += 1
+                    try:
+                        product, future = self._product(zf, members, row, pending)
+                    except ValueError as e:
+                        self._row_failed(progress, line, str(e))
+                        continue
+
+                    product.update({'seller_id': seller_id, 'seller_name': seller_name, 'created_at': datetime.utcnow()})
+                    batch.append((line, normalize('products', product), future))
+                    if future:
+                        pending.add(future)
+                    if len(batch) == self.batch_size:
+                        self._insert(batch, seller_id, progress)
+                        self._jobs.update(job_id, dict(progress))
+                        batch = []
+                if batch:
+                    self._insert(batch, seller_id, progress)
+            return progress
+        finally:
+            # The spooled file is closed by the job queue
+            text.detach()
+
+    def _product(self, zf, members, row, pending):
+        # Returns (product, render future or None); raises ValueError
+        product, image = parse_row(row)
+        info = members.get(image)
+        if info is None:
+            raise ValueError(f'{image} is not in the zip file')
+        if info.file_size > self.max_image_bytes:
+            raise ValueError(f'{image} is larger than {self.max_image_bytes // (1024 * 1024)} MB')
+
+        # Wait for a render to finish before reading another photo into memory
+        if len(pending) >= self.max_pending_images:
+            pending.intersection_update(wait(pending, return_when=FIRST_COMPLETED).not_done)
+        try:
+            image_hash, images, future = self.app.extensions['images'].submit(zf.read(info))
+        except (InvalidImage, zipfile.BadZipFile):
+            raise ValueError(f'{image} is not a valid image')
+
+        product['image_hash'] = image_hash
+        product['images'] = images
+        product['image_url'] = images['card']['jpeg']
+        product['image_status'] = 'processing' if future else 'ready'
+        return product, future
+
+    def _row_failed(self, progress, line, error):
+        progress['failed'] += 1
+        if len(progress['errors']) < MAX_ERRORS:
+            progress['errors'].append({'line': line, 'error': error})
+
+    def _insert(self, batch, seller_id, progress):
+        failed = {}
+        try:
+            db.products.insert_many([product for _, product, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            for error in e.details['writeErrors']:
+                failed[error['index']] = error['errmsg']
+
+        # mark_when_done only once the products referencing the photo exist
+        renders = {}
+        for index, (line, product, future) in enumerate(batch):
+            if index in failed:
+                print(f"Product import insert error: {failed[index]}")
+                self._row_failed(progress, line, 'Could not save the product')
+            elif future:
+                renders[product['image_hash']] = future
+        for image_hash, future in renders.items():
+            self.app.extensions['images'].mark_when_done(image_hash, future)
+
+        inserted = len(batch) - len(failed)
+        progress['imported'] += inserted
+        if inserted:
+            catalog_cache.delete_prefix(PRODUCTS_CACHE_PREFIX)
+            seller_stats.adjust_products(db, seller_id, inserted)
+
+    def shutdown(self, wait=True):
+        self._jobs.shutdown(wait=wait)
+
+
+def get_job(job_id, seller_id):
+    if not ObjectId.is_valid(job_id):
+        return None
+    return db.imports.find_one({'_id': ObjectId(job_id), 'seller_id': ref(seller_id)})
+
+
+def serialize_job(job):
+    data = {
+        'job_id': str(job['_id']),
+        'status': job['status'],
+        'total': job['total'],
+        'processed': job['processed'],
+        'imported': job['imported'],
+        'failed': job['failed'],
+        'errors': job['errors']
+    }
+    if job['status'] == 'failed':
+        data['error'] = job.get('error')
+    return data
+
+
+def init_app(app):
+    app.request_class = ImportRequest
+    app.extensions['imports'] = ProductImporter(app)
+
+
+product_importer = LocalProxy(lambda: current_app.extensions['imports'])
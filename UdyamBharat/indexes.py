@@ -0,0 +1,376 @@
+import argparse
+import json
+import sys
+import threading
+from datetime import datetime
+from bson import json_util
+from flask import has_request_context
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel, monitoring
+from checkout import IDEMPOTENCY_TTL_SECONDS
+from notifications import READ_TTL_SECONDS
+
+# Every index the app relies on, by collection. apply() makes the database
+# match: missing indexes are built, indexes whose options changed are
+# rebuilt, and indexes that are not listed are dropped. It runs from
+# init_db on every deploy and records INDEX_VERSION in schema_versions, so
+# a database already at this version is left alone; bump INDEX_VERSION
+# with every change to INDEXES.
+#
+# Each index should answer a query the app makes. To check that against
+# real traffic, record the query shapes the app issues, then audit them:
+#
+#   QUERY_SHAPES_LOG=shapes.jsonl flask run   # or benchmark.py --query-shapes
+#   python indexes.py audit shapes.jsonl [--db NAME]
+#
+# The audit runs explain on one example of each shape and reports
+# collection scans, sorts done in memory and indexes no shape used. It
+# exits 1 if it finds a collection scan or an in-memory sort, except for
+# sorts by text score or distance, which no index can provide. Only
+# queries made while handling a request are recorded, not init_db or
+# background jobs. The log holds one real example per shape, which can
+# include emails; treat it like a database dump.
+#
+# History:
+#   1  Replaces init_db's hardcoded list. orders is indexed on buyer_id
+#      (nothing writes user_id); notifications gets (user_id, _id) for
+#      changes(); orders.status_1 and notifications.created_at_1, which no
+#      query used, are dropped.
+
+INDEX_VERSION = 1
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], unique=True),
+        # seller_stats.rebuild() lists sellers
+        IndexModel([('role', ASCENDING)]),
+    ],
+    'products': [
+        # Products sharing a photo are marked ready together and its files
+        # are only removed when the last one is deleted
+        IndexModel([('image_hash', ASCENDING)]),
+        # Keyset pagination sorts on (created_at, _id); each filter shape
+        # gets a compound index with the sort key so listing never sorts
+        # in memory
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('category', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('district', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('seller_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('category', ASCENDING), ('district', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('name', TEXT), ('description', TEXT)]),
+    ],
+    'orders': [
+        # A buyer's orders (dashboard, order history, /api/orders)
+        IndexModel([('buyer_id', ASCENDING), ('created_at', DESCENDING)]),
+        # A seller's orders, newest first, and exports by date range
+        IndexModel([('seller_id', ASCENDING), ('created_at', DESCENDING)]),
+    ],
+    'cart': [
+        # One document per buyer
+        IndexModel([('buyer_id', ASCENDING)], unique=True),
+    ],
+    'checkouts': [
+        # Idempotency keys, one per buyer request, kept for a day
+        IndexModel([('buyer_id', ASCENDING), ('key', ASCENDING)], unique=True),
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ],
+    'jobs': [
+        IndexModel([('seller_id', ASCENDING), ('created_at', DESCENDING)]),
+        # Listing newest first, and nearest first by the point derived
+        # from location when a job is posted
+        IndexModel([('created_at', DESCENDING), ('_id', DESCENDING)]),
+        IndexModel([('geo', GEOSPHERE)]),
+        IndexModel([('title', TEXT), ('description', TEXT)]),
+    ],
+    'notifications': [
+        # A user's unread notifications, oldest first, for archiving
+        IndexModel([('user_id', ASCENDING), ('read', ASCENDING), ('created_at', ASCENDING)]),
+        # Keyset pagination of a user's notifications, newest first
+        IndexModel([('user_id', ASCENDING), ('created_at', DESCENDING), ('_id', DESCENDING)]),
+        # Notifications newer than the last one sent, for the event stream
+        IndexModel([('user_id', ASCENDING), ('_id', ASCENDING)]),
+        # Read notifications are removed a while after being read
+        IndexModel([('read_at', ASCENDING)], expireAfterSeconds=READ_TTL_SECONDS),
+    ],
+    'notification_counters': [],
+    'seller_stats': [],
+    'transcriptions': [
+        # Transcription jobs are only polled while the client waits for them
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=24 * 60 * 60),
+    ],
+    'imports': [
+        # Product imports are kept for a week so sellers can go back to the
+        # rows that failed
+        IndexModel([('created_at', ASCENDING)], expireAfterSeconds=7 * 24 * 60 * 60),
+    ],
+    'videos': [
+        IndexModel([('title', ASCENDING)]),
+        IndexModel([('category', ASCENDING)]),
+    ],
+}
+
+# Options that make two indexes on the same keys different
+INDEX_OPTIONS = ('unique', 'sparse', 'expireAfterSeconds', 'partialFilterExpression')
+
+
+def _matches(info, spec):
+    # info: the index as returned by index_information(); spec: an
+    # IndexModel's document
+    keys = list(spec['key'].items())
+    if any(direction == TEXT for _, direction in keys):
+        # The server reports text indexes under _fts/_ftsx, with the fields
+        # as weights
+        fields = info.get('weights') or {field for field, _ in info['key']}
+        if set(fields) != {field for field, direction in keys if direction == TEXT}:
+            return False
+    elif [tuple(key) for key in info['key']] != keys:
+        return False
+    return all(info.get(option) == spec.get(option) for option in INDEX_OPTIONS)
+
+
+def apply(db, force=False):
+    # Returns the changes made, as messages
+    state = db.schema_versions.find_one({'_id': 'indexes'})
+    if state and not force:
+        if state['version'] == INDEX_VERSION:
+            return []
+        if state['version'] > INDEX_VERSION:
+            # Code older than the database; dropping indexes the newer
+            # code added would slow it down
+            return [f"Indexes are at version {state['version']}, newer than {INDEX_VERSION}; left alone"]
+
+    changes = []
+    for collection, models in INDEXES.items():
+        current = db[collection].index_information()
+        wanted = {model.document['name']: model for model in models}
+        for name, info in list(current.items()):
+            if name == '_id_':
+                continue
+            if name not in wanted or not _matches(info, wanted[name].document):
+                db[collection].drop_index(name)
+                changes.append(f'Dropped {collection}.{name}')
+                del current[name]
+        missing = [model for name, model in wanted.items() if name not in current]
+        if missing:
+            db[collection].create_indexes(missing)
+            changes.extend(f"Built {collection}.{model.document['name']}" for model in missing)
+
+    db.schema_versions.update_one(
+        {'_id': 'indexes'},
+        {'$set': {'version': INDEX_VERSION, 'applied_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return changes
+
+
+# Query shapes
+
+# Commands that take a filter and can be explained
+EXPLAINABLE = ('find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify')
+# Session and transaction fields that explain would reject
+SESSION_FIELDS = ('lsid', 'txnNumber', 'autocommit', 'startTransaction', 'readConcern', 'writeConcern')
+
+
+def _mask(value):
+    # Field names and operators of a query with the values left out
+    if isinstance(value, dict):
+        return {key: _mask(item) for key, item in value.items()}
+    if isinstance(value, list):
+        masked = []
+        for item in map(_mask, value):
+            if item not in masked:
+                masked.append(item)
+        return masked
+    return '?'
+
+
+def _sort(sort):
+    # As pairs, since key order matters in a sort
+    return [[key, direction] for key, direction in (sort or {}).items()]
+
+
+def _filter(command):
+    name = next(iter(command))
+    if name == 'find':
+        return command.get('filter') or {}
+    if name in ('count', 'distinct', 'findAndModify'):
+        return command.get('query') or {}
+    if name == 'update':
+        return command['updates'][0].get('q') or {}
+    if name == 'delete':
+        return command['deletes'][0].get('q') or {}
+    first = (command.get('pipeline') or [{}])[0]
+    return first.get('$match') or {}
+
+
+def shape(command):
+    # What decides the plan for command: collection, command, filter and
+    # sort, or the pipeline with its values left out
+    name = next(iter(command))
+    result = {'collection': command[name], 'command': name}
+    if name == 'aggregate':
+        result['pipeline'] = [
+            {'$sort': _sort(stage['$sort'])} if '$sort' in stage else _mask(stage)
+            for stage in command.get('pipeline', [])
+        ]
+        return result
+    result['filter'] = _mask(_filter(command))
+    if name in ('find', 'findAndModify'):
+        result['sort'] = _sort(command.get('sort'))
+    if name == 'distinct':
+        result['key'] = command['key']
+    return result
+
+
+def example(command):
+    # command without session fields and with one statement per write, so
+    # it can be passed to explain
+    result = {key: value for key, value in command.items()
+              if not key.startswith('$') and key not in SESSION_FIELDS}
+    for statements in ('updates', 'deletes'):
+        if statements in result:
+            result[statements] = result[statements][:1]
+    return result
+
+
+class ShapeRecorder(monitoring.CommandListener):
+    # Appends the first example of each new shape to path as a line of
+    # extended JSON. Each process keeps its own set of shapes seen, so a
+    # shape may appear once per worker; load_shapes() merges them.
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._seen = set()
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE or not has_request_context():
+            return
+        command = dict(event.command)
+        key = json.dumps(shape(command), sort_keys=True)
+        with self._lock:
+            if key in self._seen:
+                return
+            self._seen.add(key)
+            with open(self.path, 'a') as f:
+                f.write(json_util.dumps({'shape': key, 'example': example(command)}) + '\n')
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def load_shapes(path):
+    # {shape key: example command}
+    shapes = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json_util.loads(line)
+                shapes.setdefault(record['shape'], record['example'])
+    return shapes
+
+
+# Audit
+
+def _plan_stages(node):
+    # Every stage of the winning plan in an explain result
+    if isinstance(node, list):
+        for item in node:
+            yield from _plan_stages(item)
+    elif isinstance(node, dict):
+        if 'stage' in node:
+            yield node
+        for key, value in node.items():
+            if key not in ('rejectedPlans', 'slotBasedPlan', 'command', 'executionStats'):
+                yield from _plan_stages(value)
+
+
+def analyze(explain, command):
+    # Returns (indexes used, problems, notes) for one explain result
+    stages = list(_plan_stages(explain))
+    indexes = {stage['indexName'] for stage in stages if 'indexName' in stage}
+    problems = []
+    notes = []
+    if any(stage['stage'] == 'COLLSCAN' for stage in stages) and _filter(command):
+        problems.append('collection scan')
+
+    # A SORT stage, or a $sort the query layer could not take over, sorts
+    # in memory
+    pipeline_stages = [next(iter(stage)) for stage in explain.get('stages', [])]
+    if any(stage['stage'] == 'SORT' for stage in stages) or '$sort' in pipeline_stages:
+        first = (command.get('pipeline') or [{}])[0] if 'aggregate' in command else {}
+        if '$geoNear' in first or '$text' in first.get('$match', {}):
+            notes.append('in-memory sort by distance or text score')
+        else:
+            problems.append('in-memory sort')
+    return indexes, problems, notes
+
+
+def audit(db, shapes, out=sys.stdout):
+    # Prints a report for shapes ({shape key: example}); returns the
+    # number of problems found
+    used = {}
+    problems_found = 0
+    for key, command in sorted(shapes.items()):
+        described = json.loads(key)
+        collection = described['collection']
+        explain = db.command({'explain': command, 'verbosity': 'queryPlanner'})
+        indexes, problems, notes = analyze(explain, command)
+        used.setdefault(collection, set()).update(indexes)
+        problems_found += len(problems)
+
+        query = described.get('pipeline', described.get('filter'))
+        sort = f" sort {described['sort']}" if described.get('sort') else ''
+        print(f"{collection}.{described['command']} {json.dumps(query)}{sort}", file=out)
+        print(f"    indexes: {', '.join(sorted(indexes)) or 'none'}", file=out)
+        for problem in problems:
+            print(f'    PROBLEM {problem}', file=out)
+        for note in notes:
+            print(f'    note: {note}', file=out)
+
+    print('\nIndexes no recorded query used (ops since the server started):', file=out)
+    for collection in sorted(set(INDEXES) | set(used)):
+        stats = {row['name']: row['accesses'] for row in db[collection].aggregate([{'$indexStats': {}}])}
+        for name, info in sorted(db[collection].index_information().items()):
+            # Unique and TTL indexes do their job without being queried
+            if name == '_id_' or info.get('unique') or 'expireAfterSeconds' in info:
+                continue
+            if name not in used.get(collection, set()):
+                accesses = stats.get(name, {})
+                print(f"    {collection}.{name} ({accesses.get('ops', 0)} ops since {accesses.get('since', '-')})", file=out)
+
+    print(f'\n{len(shapes)} query shapes, {problems_found} problems', file=out)
+    return problems_found
+
+
+def init_app(app):
+    # Picked up by database.create_client() when the client is created
+    if app.config['QUERY_SHAPES_LOG']:
+        app.config.setdefault('MONGODB_EVENT_LISTENERS', []).append(ShapeRecorder(app.config['QUERY_SHAPES_LOG']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Apply the index spec or audit recorded query shapes')
+    commands = parser.add_subparsers(dest='action', required=True)
+    apply_parser = commands.add_parser('apply', help='build and drop indexes to match INDEXES')
+    apply_parser.add_argument('--force', action='store_true', help='apply even if already at INDEX_VERSION')
+    audit_parser = commands.add_parser('audit', help='explain each recorded query shape')
+    audit_parser.add_argument('shapes', help='file written by QUERY_SHAPES_LOG or benchmark.py --query-shapes')
+    audit_parser.add_argument('--db', help='database to explain against; defaults to MONGODB_DB')
+    args = parser.parse_args()
+
+    from app import app
+    from database import get_client, get_db
+
+    with app.app_context():
+        if args.action == 'apply':
+            for change in apply(get_db(), args.force) or ['Indexes are up to date']:
+                print(change)
+            return
+        db = get_client()[args.db] if args.db else get_db()
+        sys.exit(1 if audit(db, load_shapes(args.shapes)) else 0)
+
+
+if __name__ == '__main__':
+    main()
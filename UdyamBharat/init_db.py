@@ -1,56 +1,33 @@
-from pymongo import MongoClient, ASCENDING, TEXT
 from config import Config
+from indexes import apply as apply_indexes
+from notifications import rebuild_counters
+from seller_stats import rebuild as rebuild_seller_stats
+from cart import fold_line_documents
+from jobs import backfill_geo
 import os
 
-def init_db():
-    # Connect to MongoDB
-    client = MongoClient(Config.MONGODB_URI)
-    db = client[Config.MONGODB_DB]
-    
+def init_db(db):
     # Create collections if they don't exist
-    collections = ['users', 'products', 'orders', 'cart', 'jobs', 'notifications', 'videos']
+    collections = ['users', 'products', 'orders', 'cart', 'checkouts', 'jobs', 'notifications', 'notification_counters', 'seller_stats', 'videos', 'transcriptions', 'imports']
     for collection in collections:
         if collection not in db.list_collection_names():
             db.create_collection(collection)
     
-    # Create indexes
-    # Users collection
-    db.users.create_index([('email', ASCENDING)], unique=True)
-    db.users.create_index([('role', ASCENDING)])
-    
-    # Products collection
-    db.products.create_index([('seller_id', ASCENDING)])
-    db.products.create_index([('category', ASCENDING)])
-    db.products.create_index([('district', ASCENDING)])
-    db.products.create_index([
-        ('name', TEXT),
-        ('description', TEXT)
-    ])
-    
-    # Orders collection
-    db.orders.create_index([('user_id', ASCENDING)])
-    db.orders.create_index([('seller_id', ASCENDING)])
-    db.orders.create_index([('status', ASCENDING)])
+    # Data written before the current schema is brought up to date first:
+    # the unique index on cart.buyer_id needs carts saved one line per
+    # document merged, and jobs need a point before proximity search
+    fold_line_documents(db)
+    backfill_geo(db)
     
-    # Cart collection
-    db.cart.create_index([('user_id', ASCENDING)])
-    db.cart.create_index([('product_id', ASCENDING)])
+    # Indexes, as declared in indexes.py
+    for change in apply_indexes(db):
+        print(change)
     
-    # Jobs collection
-    db.jobs.create_index([('seller_id', ASCENDING)])
-    db.jobs.create_index([('location', ASCENDING)])
-    db.jobs.create_index([
-        ('title', TEXT),
-        ('description', TEXT)
-    ])
+    # Counters for notifications that already exist
+    rebuild_counters(db)
     
-    # Notifications collection
-    db.notifications.create_index([('user_id', 1), ('read', 1)])
-    db.notifications.create_index('created_at')
-    
-    # Videos collection
-    db.videos.create_index('title')
-    db.videos.create_index('category')
+    # Dashboard summaries for data that already exists
+    rebuild_seller_stats(db)
     
     # Create necessary directories
     os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
@@ -62,4 +39,8 @@ def init_db():
     print("Database initialized successfully!")
 
 if __name__ == '__main__':
-    init_db() 
\ No newline at end of file
+    from app import app
+    from database import get_db
+    
+    with app.app_context():
+        init_db(get_db()) 
\ No newline at end of file
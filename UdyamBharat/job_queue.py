@@ -0,0 +1,100 @@
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from database import db
+
+# Runs background jobs for a request that should not wait for them, such
+# as transcription and bulk product import. The request hands over its
+# uploads and gets a job id back right away:
+#   - at most workers + max_queue jobs are running or waiting per process;
+#     beyond that submit() raises the service's busy exception instead of
+#     holding more uploads
+#   - each upload is copied into a SpooledTemporaryFile: in memory up to
+#     spool_max_bytes, then an anonymous temp file that the OS removes
+#     when it is closed
+#   - job state is a document in `collection` ({status: queued, running,
+#     completed or failed, created_at, updated_at, ...}), so any worker
+#     can answer a status poll, not just the one running the job
+# The uploads are closed and the slot given back when the job ends, however
+# it ends.
+
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+def spool(stream, max_size):
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        shutil.copyfileobj(stream, spooled)
+        spooled.seek(0)
+    except Exception:
+        spooled.close()
+        raise
+    return spooled
+
+
+class JobQueue:
+    def __init__(self, app, name, collection, workers, max_queue, spool_max_bytes, busy):
+        # name labels the worker threads and error logs; busy is the
+        # exception raised when the queue is full
+        self.app = app
+        self.name = name
+        self.collection = collection
+        self.spool_max_bytes = spool_max_bytes
+        self.busy = busy
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(workers + max_queue)
+
+    def submit(self, streams, job, run, check=None):
+        # Spools streams, stores job with status queued and returns its id.
+        # run(job_id, *files) does the work in the background and returns
+        # the fields to store with status completed; an exception marks the
+        # job failed. check(*files), if given, runs before the job is stored
+        # and may raise to reject the upload.
+        if not self._slots.acquire(blocking=False):
+            raise self.busy()
+
+        files = []
+        try:
+            for stream in streams:
+                files.append(spool(stream, self.spool_max_bytes))
+            if check:
+                check(*files)
+
+            now = datetime.utcnow()
+            job_id = db[self.collection].insert_one(dict(
+                job,
+                status='queued',
+                created_at=now,
+                updated_at=now
+            )).inserted_id
+
+            self._executor.submit(self._run, job_id, files, run)
+        except Exception:
+            for f in files:
+                f.close()
+            self._slots.release()
+            raise
+        return job_id
+
+    def update(self, job_id, fields):
+        fields['updated_at'] = datetime.utcnow()
+        db[self.collection].update_one({'_id': job_id}, {'$set': fields})
+
+    def _run(self, job_id, files, run):
+        with self.app.app_context():
+            try:
+                self.update(job_id, {'status': 'running'})
+                fields = run(job_id, *files)
+                self.update(job_id, dict(fields, status='completed'))
+            except Exception as e:
+                print(f"{self.name} job error: {str(e)}")
+                self.update(job_id, {'status': 'failed', 'error': str(e)})
+            finally:
+                for f in files:
+                    f.close()
+                self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,174 @@
+import re
+from datetime import datetime
+from pagination import DEFAULT_PAGE_SIZE, decode_cursor, encode_cursor, keyset_filter, page_size, paginate
+from refs import normalize
+
+# Job listings are read a page at a time in one of three orders, each with
+# a keyset cursor over (sort key, _id):
+#   newest first   created_at, from the (created_at, _id) index
+#   keyword search $text score, from the text index on title/description
+#   nearest first  distance from a point, from the 2dsphere index on geo
+# geo is a GeoJSON point set when the job is posted: explicit coordinates
+# from the browser if given, otherwise the district named in the free-text
+# location, looked up in DISTRICTS. Jobs without a point are left out of
+# proximity results only.
+
+DEFAULT_RADIUS_KM = 50
+MAX_RADIUS_KM = 500
+
+# District headquarters, (longitude, latitude)
+DISTRICTS = {
+    'Anantnag': (75.1487, 33.7311),
+    'Bandipora': (74.6430, 34.4170),
+    'Baramulla': (74.3640, 34.1980),
+    'Budgam': (74.7180, 34.0200),
+    'Doda': (75.5480, 33.1450),
+    'Ganderbal': (74.7740, 34.2270),
+    'Jammu': (74.8570, 32.7266),
+    'Kargil': (76.1349, 34.5539),
+    'Kathua': (75.5254, 32.3693),
+    'Kishtwar': (75.7660, 33.3110),
+    'Kulgam': (75.0190, 33.6450),
+    'Kupwara': (74.2660, 34.5310),
+    'Leh': (77.5771, 34.1526),
+    'Poonch': (74.0927, 33.7700),
+    'Pulwama': (74.8990, 33.8740),
+    'Rajouri': (74.3150, 33.3770),
+    'Ramban': (75.2390, 33.2430),
+    'Reasi': (74.8345, 33.0810),
+    'Samba': (75.1199, 32.5625),
+    'Shopian': (74.8340, 33.7170),
+    'Srinagar': (74.7973, 34.0837),
+    'Udhampur': (75.1416, 32.9160),
+}
+
+_DISTRICT_PATTERN = re.compile(r'\b(' + '|'.join(DISTRICTS) + r')\b', re.IGNORECASE)
+_DISTRICT_NAMES = {name.lower(): name for name in DISTRICTS}
+
+
+def point(lng, lat):
+    # Raises ValueError unless lng/lat are valid coordinates
+    lng, lat = float(lng), float(lat)
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        raise ValueError('Coordinates out of range')
+    return {'type': 'Point', 'coordinates': [lng, lat]}
+
+
+def locate(location):
+    # GeoJSON point for the first district named in location, or None
+    match = _DISTRICT_PATTERN.search(location or '')
+    if not match:
+        return None
+    return point(*DISTRICTS[_DISTRICT_NAMES[match.group(1).lower()]])
+
+
+def parse_near(raw):
+    # "lat,lng" or a district name; raises ValueError otherwise
+    name = _DISTRICT_NAMES.get(raw.strip().lower())
+    if name:
+        return point(*DISTRICTS[name])
+    try:
+        lat, lng = raw.split(',')
+    except ValueError:
+        raise ValueError('near must be "latitude,longitude" or a district name')
+    return point(lng, lat)
+
+
+def create_job(db, seller_id, title, description, location, latitude=None, longitude=None):
+    # Raises ValueError for invalid coordinates
+    job = {
+        'title': title,
+        'description': description,
+        'location': location,
+        'seller_id': seller_id,
+        'created_at': datetime.utcnow()
+    }
+    geo = point(longitude, latitude) if latitude and longitude else locate(location)
+    if geo:
+        job['geo'] = geo
+    db.jobs.insert_one(normalize('jobs', job))
+    return job
+
+
+def find_jobs(db, text=None, near=None, radius_km=DEFAULT_RADIUS_KM, cursor_token=None,
+              limit=DEFAULT_PAGE_SIZE):
+    # Returns (jobs, next_cursor). near is a GeoJSON point; it cannot be
+    # combined with text, since $text and $geoNear must both come first.
+    # Raises ValueError for an invalid cursor.
+    if text and near:
+        raise ValueError('Search and proximity sorting cannot be combined')
+    if not text and not near:
+        return paginate(db.jobs, {}, 'created_at', cursor_token, limit)
+
+    if text:
+        sort_field, direction = 'score', -1
+        pipeline = [
+            {'$match': {'$text': {'$search': text}}},
+            {'$addFields': {'score': {'$meta': 'textScore'}}}
+        ]
+    else:
+        sort_field, direction = 'distance', 1
+        radius = min(radius_km, MAX_RADIUS_KM) * 1000
+        geo_near = {'near': near, 'distanceField': 'distance', 'maxDistance': radius, 'spherical': True}
+        if cursor_token:
+            # Skip the index scan up to the last distance returned
+            geo_near['minDistance'] = decode_cursor(cursor_token)[0]
+        pipeline = [{'$geoNear': geo_near}]
+
+    if cursor_token:
+        pipeline.append({'$match': keyset_filter(sort_field, decode_cursor(cursor_token), direction)})
+    # _id breaks ties, which are common for jobs located by district
+    pipeline += [
+        {'$sort': {sort_field: direction, '_id': direction}},
+        {'$limit': limit + 1}
+    ]
+    jobs = list(db.jobs.aggregate(pipeline))
+
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = encode_cursor(jobs[-1], sort_field)
+    return jobs, next_cursor
+
+
+def find_jobs_for_args(db, args):
+    # find_jobs() with the q, near, radius (km), cursor and limit query
+    # parameters of the jobs page and API; raises ValueError for bad input
+    near = parse_near(args['near']) if args.get('near') else None
+    radius_km = max(1, args.get('radius', DEFAULT_RADIUS_KM, type=float))
+    return find_jobs(
+        db,
+        args.get('q', '').strip() or None,
+        near,
+        radius_km,
+        args.get('cursor'),
+        page_size(args.get('limit'))
+    )
+
+
+def serialize_job(job):
+    data = {
+        '_id': str(job['_id']),
+        'title': job['title'],
+        'description': job['description'],
+        'location': job['location'],
+        'seller_id': str(job['seller_id']),
+        'created_at': job['created_at'].isoformat()
+    }
+    if 'geo' in job:
+        lng, lat = job['geo']['coordinates']
+        data['latitude'], data['longitude'] = lat, lng
+    if 'distance' in job:
+        data['distance_km'] = round(job['distance'] / 1000, 1)
+    return data
+
+
+def backfill_geo(db):
+    # Points for jobs posted before geo was stored; returns how many were set
+    updated = 0
+    for job in db.jobs.find({'geo': {'$exists': False}}, {'location': 1}):
+        geo = locate(job.get('location'))
+        if geo:
+            db.jobs.update_one({'_id': job['_id']}, {'$set': {'geo': geo}})
+            updated += 1
+    return updated
@@ -0,0 +1,25 @@
+import os
+import threading
+
+# Holder for objects that are expensive to import or build, such as the
+# AssemblyAI, ElevenLabs and Gemini SDK clients. Nothing happens until
+# the first get(), so workers that never use a client never pay for it,
+# and the result is then shared by every thread in the process. Like
+# database.Mongo it is rebuilt after fork(), so a client created in a
+# preloading master is not shared with its workers.
+
+
+class Lazy:
+    def __init__(self, factory):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self._value = None
+        self._pid = None
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._value = self._factory()
+                    self._pid = os.getpid()
+        return self._value
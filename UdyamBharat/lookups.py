@@ -0,0 +1,43 @@
+from bson import ObjectId
+
+# Batched joins from orders and cart lines to their products. Every view
+# that needs product data for a list of rows goes through here so the
+# cost is one $in query regardless of how many rows there are.
+
+
+def _object_ids(values):
+    # Stored product ids are ObjectIds (see refs.py), but callers may pass
+    # them as strings, as exports does with its name cache keys. Values
+    # that are not valid ids are skipped.
+    ids = set()
+    for value in values:
+        if value is not None and ObjectId.is_valid(str(value)):
+            ids.add(ObjectId(str(value)))
+    return list(ids)
+
+
+def products_by_id(db, product_ids, fields=None, session=None):
+    ids = _object_ids(product_ids)
+    if not ids:
+        return {}
+    projection = {field: 1 for field in fields} if fields else None
+    return {
+        str(product['_id']): product
+        for product in db.products.find({'_id': {'$in': ids}}, projection, session=session)
+    }
+
+
+def join_products(db, docs, fields=None, key='product_id'):
+    # Yields (doc, product) pairs; product is None when it no longer exists
+    docs = list(docs)
+    products = products_by_id(db, (doc.get(key) for doc in docs), fields)
+    for doc in docs:
+        yield doc, products.get(str(doc.get(key)))
+
+
+def attach_product_names(db, orders):
+    orders = list(orders)
+    for order, product in join_products(db, orders, ['name']):
+        if product:
+            order['product_name'] = product['name']
+    return orders
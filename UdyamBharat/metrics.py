@@ -0,0 +1,312 @@
+import hmac
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from flask import Response, abort, current_app, request
+from pymongo import monitoring
+
+# Per-process metrics in the Prometheus text format, served at /metrics:
+#   - latency and MongoDB command count of every request, by route
+#   - MongoDB command durations by collection and command, recorded by a
+#     CommandListener that database.create_client() attaches to the client
+#   - time spent in AssemblyAI, ElevenLabs and Gemini calls (external())
+#   - password hashes waiting for or running on passwords.py's executor,
+#     how long they take and how many were turned away
+#   - the most recent requests slower than SLOW_REQUEST_SECONDS, as
+#     comment lines at the end, which scrapers ignore
+# A request that makes more than QUERY_BUDGET commands is logged, so N+1
+# query patterns show up before someone complains. With several gunicorn
+# workers each one reports its own figures; Prometheus sums them.
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COMMAND_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+EXTERNAL_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PASSWORD_HASH_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SLOW_REQUEST_SAMPLES = 50
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, values, amount):
+        # Called with the registry lock held
+        series = self._series.get(values)
+        if series is None:
+            series = self._series[values] = [[0] * len(self.buckets), 0, 0]
+        for i, bound in enumerate(self.buckets):
+            if amount <= bound:
+                series[0][i] += 1
+        series[1] += amount
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, (counts, total, count) in sorted(self._series.items()):
+            for bound, bucket in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_labels(self.labels, values, [("le", _number(bound))])} {bucket}')
+            lines.append(f'{self.name}_bucket{_labels(self.labels, values, [("le", "+Inf")])} {count}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {_number(round(total, 6))}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, values, amount=1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, count in sorted(self._series.items()):
+            lines.append(f'{self.name}{_labels(self.labels, values)} {count}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+
+    def inc(self, values, amount=1):
+        self._series[values] = self._series.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        for values, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{_labels(self.labels, values)} {value}')
+        return lines
+
+
+class _Listener(monitoring.CommandListener):
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        self.metrics._command_started(event)
+
+    def succeeded(self, event):
+        self.metrics._command_finished(event, 'ok')
+
+    def failed(self, event):
+        self.metrics._command_finished(event, 'failed')
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Collection of each command in flight, until it finishes
+        self._commands = {}
+        self.slow_requests = deque(maxlen=SLOW_REQUEST_SAMPLES)
+        self.request_seconds = Histogram(
+            'udyambharat_request_duration_seconds',
+            'Time to produce the response, by route',
+            ('method', 'route', 'status'),
+            REQUEST_BUCKETS
+        )
+        self.request_commands = Histogram(
+            'udyambharat_request_mongo_commands',
+            'MongoDB commands per request, by route',
+            ('method', 'route'),
+            COMMAND_COUNT_BUCKETS
+        )
+        self.command_seconds = Histogram(
+            'udyambharat_mongo_command_duration_seconds',
+            'MongoDB command round trips, by collection and command',
+            ('collection', 'command', 'outcome'),
+            COMMAND_BUCKETS
+        )
+        self.external_seconds = Histogram(
+            'udyambharat_external_call_duration_seconds',
+            'Calls to external APIs, by service',
+            ('service', 'outcome'),
+            EXTERNAL_BUCKETS
+        )
+        self.budget_exceeded = Counter(
+            'udyambharat_query_budget_exceeded_total',
+            'Requests that made more MongoDB commands than QUERY_BUDGET',
+            ('method', 'route')
+        )
+        self.password_queue = Gauge(
+            'udyambharat_password_hash_queue_depth',
+            'Password hashes running or waiting for a hashing thread',
+            ()
+        )
+        self.password_queue.inc((), 0)
+        self.password_seconds = Histogram(
+            'udyambharat_password_hash_duration_seconds',
+            'Time to hash or check a password, by operation',
+            ('operation',),
+            PASSWORD_HASH_BUCKETS
+        )
+        self.password_rejected = Counter(
+            'udyambharat_password_hash_rejected_total',
+            'Password hashes refused because the queue was full, by operation',
+            ('operation',)
+        )
+        self.listener = _Listener(self)
+
+    def _command_started(self, event):
+        name = event.command_name
+        collection = event.command.get(name)
+        if not isinstance(collection, str):
+            # getMore names the collection separately; admin commands have none
+            collection = event.command.get('collection', '')
+        with self._lock:
+            self._commands[(event.connection_id, event.request_id)] = collection
+        # Commands are published on the thread that sends them, which is
+        # the one handling the request
+        if getattr(self._local, 'request', None) is not None:
+            self._local.request['commands'] += 1
+
+    def _command_finished(self, event, outcome):
+        seconds = event.duration_micros / 1e6
+        with self._lock:
+            collection = self._commands.pop((event.connection_id, event.request_id), '')
+            self.command_seconds.observe((collection, event.command_name, outcome), seconds)
+        if getattr(self._local, 'request', None) is not None:
+            self._local.request['command_seconds'] += seconds
+
+    def start_request(self):
+        self._local.request = {'started': time.perf_counter(), 'commands': 0, 'command_seconds': 0}
+
+    def finish_request(self, method, route, path, status, query_budget=None, slow_seconds=None):
+        current = getattr(self._local, 'request', None)
+        if current is None:
+            return
+        self._local.request = None
+        seconds = time.perf_counter() - current['started']
+        commands = current['commands']
+
+        with self._lock:
+            self.request_seconds.observe((method, route, str(status)), seconds)
+            self.request_commands.observe((method, route), commands)
+            if query_budget and commands > query_budget:
+                self.budget_exceeded.inc((method, route))
+            if slow_seconds and seconds > slow_seconds:
+                self.slow_requests.append({
+                    'at': datetime.utcnow().isoformat(timespec='seconds'),
+                    'method': method,
+                    'path': path,
+                    'status': status,
+                    'seconds': round(seconds, 3),
+                    'commands': commands,
+                    'command_seconds': round(current['command_seconds'], 3)
+                })
+
+        if query_budget and commands > query_budget:
+            print(f"Query budget exceeded: {method} {path} made {commands} MongoDB commands (budget {query_budget})")
+
+    @contextmanager
+    def external(self, service):
+        started = time.perf_counter()
+        outcome = 'failed'
+        try:
+            yield
+            outcome = 'ok'
+        finally:
+            with self._lock:
+                self.external_seconds.observe((service, outcome), time.perf_counter() - started)
+
+    def password_queue_changed(self, delta):
+        with self._lock:
+            self.password_queue.inc((), delta)
+
+    def password_hash_rejected(self, operation):
+        with self._lock:
+            self.password_rejected.inc((operation,))
+
+    @contextmanager
+    def password_hash(self, operation):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.password_seconds.observe((operation,), time.perf_counter() - started)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_seconds, self.request_commands, self.command_seconds,
+                           self.external_seconds, self.budget_exceeded, self.password_queue,
+                           self.password_seconds, self.password_rejected):
+                lines.extend(metric.render())
+            lines.append('# Recent requests slower than SLOW_REQUEST_SECONDS, oldest first')
+            for sample in self.slow_requests:
+                lines.append('# slow_request ' + ' '.join(f'{key}={value}' for key, value in sample.items()))
+        return '\n'.join(lines) + '\n'
+
+
+# One registry per process, shared by every app in it, so background
+# threads without an app context can record to it too
+metrics = Metrics()
+
+
+def token_required(view):
+    # For /metrics and other operational endpoints: when METRICS_TOKEN is
+    # set, it must be sent as a bearer token
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = current_app.config['METRICS_TOKEN']
+        if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            abort(401)
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def init_app(app):
+    # Picked up by database.create_client() when the client is created
+    app.config.setdefault('MONGODB_EVENT_LISTENERS', []).append(metrics.listener)
+
+    @app.before_request
+    def start_request():
+        metrics.start_request()
+
+    @app.after_request
+    def finish_request(response):
+        route = request.url_rule.rule if request.url_rule else '<unmatched>'
+        metrics.finish_request(
+            request.method,
+            route,
+            request.path,
+            response.status_code,
+            app.config['QUERY_BUDGET'],
+            app.config['SLOW_REQUEST_SECONDS']
+        )
+        return response
+
+    @token_required
+    def serve_metrics():
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', serve_metrics)
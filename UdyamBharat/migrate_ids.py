@@ -0,0 +1,120 @@
+import argparse
+import copy
+from datetime import datetime
+from pymongo import UpdateOne
+from notifications import rebuild_counters
+from refs import REFERENCE_FIELDS, normalize
+import seller_stats
+
+# Rewrites reference fields stored as hex strings to ObjectIds (see
+# refs.py). Each collection is scanned in _id order in batches of
+# --batch-size; after every batch the last _id is saved in the migrations
+# collection, so an interrupted run continues where it stopped. Values
+# that are not valid ids are left as they are and reported.
+#
+# Summaries keyed by user (notification_counters, seller_stats) are
+# rebuilt from the migrated data at the end.
+#
+#   python migrate_ids.py [--batch-size N] [--restart] [collection ...]
+
+MIGRATION = 'normalize_ids'
+DEFAULT_BATCH_SIZE = 1000
+
+
+def _string_filter(collection):
+    return {'$or': [{path: {'$type': 'string'}} for path in REFERENCE_FIELDS[collection]]}
+
+
+def _top_level(collection):
+    return {path.split('.')[0] for path in REFERENCE_FIELDS[collection]}
+
+
+def migrate_collection(db, collection, batch_size=DEFAULT_BATCH_SIZE, restart=False, report=print):
+    progress_id = f'{MIGRATION}:{collection}'
+    if restart:
+        db.migrations.delete_one({'_id': progress_id})
+    progress = db.migrations.find_one({'_id': progress_id}, {'_id': 0, 'updated_at': 0}) or {
+        'last_id': None, 'scanned': 0, 'converted': 0, 'invalid': 0, 'done': False
+    }
+    if progress['done']:
+        report(f"{collection}: already migrated ({progress['converted']} converted)")
+        return progress
+
+    # Documents already checked by an interrupted run count towards the total
+    total = progress['scanned'] + db[collection].count_documents(_string_filter(collection))
+    report(f"{collection}: {total} documents to check")
+
+    while True:
+        query = _string_filter(collection)
+        if progress['last_id'] is not None:
+            query = {'$and': [query, {'_id': {'$gt': progress['last_id']}}]}
+        batch = list(db[collection].find(query).sort('_id', 1).limit(batch_size))
+        if not batch:
+            break
+
+        updates = []
+        for doc in batch:
+            original = {field: doc[field] for field in _top_level(collection) if field in doc}
+            try:
+                fields = normalize(collection, copy.deepcopy(original))
+            except ValueError:
+                progress['invalid'] += 1
+                continue
+            # Only write if the document still has the values that were read
+            updates.append(UpdateOne({'_id': doc['_id'], **original}, {'$set': fields}))
+
+        if updates:
+            result = db[collection].bulk_write(updates, ordered=False)
+            progress['converted'] += result.modified_count
+
+        progress['scanned'] += len(batch)
+        progress['last_id'] = batch[-1]['_id']
+        _save(db, progress_id, progress)
+        report(
+            f"{collection}: {progress['scanned']}/{total} checked, "
+            f"{progress['converted']} converted, {progress['invalid']} invalid"
+        )
+
+    progress['done'] = True
+    _save(db, progress_id, progress)
+    return progress
+
+
+def _save(db, progress_id, progress):
+    db.migrations.update_one(
+        {'_id': progress_id},
+        {'$set': {**progress, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+
+
+def rebuild_summaries(db, report=print):
+    # Documents keyed by the old string ids are dropped and recomputed
+    for collection in ('notification_counters', 'seller_stats'):
+        removed = db[collection].delete_many({'_id': {'$type': 'string'}}).deleted_count
+        report(f"{collection}: removed {removed} documents keyed by string id")
+    report(f"notification_counters: rebuilt for {rebuild_counters(db)} users")
+    report(f"seller_stats: rebuilt for {seller_stats.rebuild(db)} sellers")
+
+
+def migrate(db, collections=None, batch_size=DEFAULT_BATCH_SIZE, restart=False, report=print):
+    for collection in collections or REFERENCE_FIELDS:
+        migrate_collection(db, collection, batch_size, restart, report)
+    rebuild_summaries(db, report)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert string reference ids to ObjectIds')
+    parser.add_argument('collections', nargs='*', metavar='collection', help=', '.join(REFERENCE_FIELDS))
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument('--restart', action='store_true', help='ignore saved progress')
+    args = parser.parse_args()
+    unknown = set(args.collections) - set(REFERENCE_FIELDS)
+    if unknown:
+        parser.error(f"unknown collections: {', '.join(sorted(unknown))}")
+
+    from app import app
+    from database import get_db
+
+    with app.app_context():
+        migrate(get_db(), args.collections, args.batch_size, args.restart)
@@ -0,0 +1,177 @@
+import time
+from collections import Counter
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from refs import ref
+
+# Each user's unread count is kept in notification_counters
+# ({_id: user_id, unread, version, updated_at}) and changed together with
+# the notifications it counts, so reading it is one _id lookup instead of
+# a scan. version goes up on every write, which is what changes() watches
+# to push updates to connected clients.
+#
+# Growth is bounded: read notifications are removed by a TTL index on
+# read_at after READ_TTL_SECONDS, and when a user has more than MAX_UNREAD
+# unread the oldest are archived (marked read) so they age out as well.
+# rebuild_counters() recomputes every counter from the notifications
+# themselves, for existing data or after a crash between the two writes.
+
+READ_TTL_SECONDS = 30 * 24 * 60 * 60
+MAX_UNREAD = 200
+# Notifications sent with a single change event
+CHANGES_BATCH_SIZE = 20
+
+
+def _user_key(user_id):
+    return ref(user_id)
+
+
+def notify(db, notifications, session=None):
+    # notifications: dicts with at least user_id and message
+    if not notifications:
+        return
+
+    now = datetime.utcnow()
+    unread = Counter()
+    for notification in notifications:
+        notification['user_id'] = _user_key(notification['user_id'])
+        notification.setdefault('type', 'order')
+        notification.setdefault('read', False)
+        notification.setdefault('created_at', now)
+        unread[notification['user_id']] += 1
+
+    db.notifications.insert_many(notifications, session=session)
+    updates = {
+        user_id: {'$inc': {'unread': count, 'version': 1}, '$set': {'updated_at': now}}
+        for user_id, count in unread.items()
+    }
+    if len(updates) == 1:
+        [(user_id, update)] = updates.items()
+        counters = [db.notification_counters.find_one_and_update(
+            {'_id': user_id},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )]
+    else:
+        # A checkout notifies every seller in the cart: one bulk_write for
+        # the counters and one read for any that went over MAX_UNREAD,
+        # however many sellers there are
+        db.notification_counters.bulk_write(
+            [UpdateOne({'_id': user_id}, update, upsert=True) for user_id, update in updates.items()],
+            ordered=False,
+            session=session
+        )
+        counters = db.notification_counters.find(
+            {'_id': {'$in': list(updates)}, 'unread': {'$gt': MAX_UNREAD}},
+            {'unread': 1},
+            session=session
+        )
+    for counter in counters:
+        if counter['unread'] > MAX_UNREAD:
+            _archive_oldest(db, counter['_id'], counter['unread'] - MAX_UNREAD, session)
+
+
+def _archive_oldest(db, user_id, count, session=None):
+    oldest = db.notifications.find(
+        {'user_id': user_id, 'read': False},
+        {'_id': 1},
+        session=session
+    ).sort('created_at', ASCENDING).limit(count)
+    mark_read(db, user_id, [notification['_id'] for notification in oldest], session)
+
+
+def mark_read(db, user_id, notification_ids=None, session=None):
+    # Marks the given notifications, or all of the user's, as read and
+    # returns how many were unread
+    user_id = _user_key(user_id)
+    query = {'user_id': user_id, 'read': False}
+    if notification_ids is not None:
+        query['_id'] = {'$in': list(notification_ids)}
+
+    now = datetime.utcnow()
+    result = db.notifications.update_many(
+        query,
+        {'$set': {'read': True, 'read_at': now}},
+        session=session
+    )
+    # Only documents that were still unread are modified, so concurrent
+    # calls for the same notifications cannot decrement twice
+    if result.modified_count:
+        db.notification_counters.update_one(
+            {'_id': user_id},
+            {'$inc': {'unread': -result.modified_count, 'version': 1}, '$set': {'updated_at': now}},
+            session=session
+        )
+    return result.modified_count
+
+
+def _counter(db, user_id):
+    return db.notification_counters.find_one({'_id': _user_key(user_id)})
+
+
+def unread_count(db, user_id):
+    counter = _counter(db, user_id)
+    return max(counter['unread'], 0) if counter else 0
+
+
+def serialize_notification(notification):
+    return {
+        '_id': str(notification['_id']),
+        'message': notification['message'],
+        'type': notification.get('type'),
+        'read': notification['read'],
+        'created_at': notification['created_at'].isoformat()
+    }
+
+
+def changes(db, user_id, interval, timeout):
+    # Yields ('unread', count) once, then ('notification', doc) for each
+    # new notification and ('unread', count) whenever the count changes,
+    # until timeout seconds have passed. Only the counter is read while
+    # nothing changes.
+    user_id = _user_key(user_id)
+    newest = db.notifications.find_one({'user_id': user_id}, {'_id': 1}, sort=[('_id', DESCENDING)])
+    last_id = newest['_id'] if newest else None
+    counter = _counter(db, user_id)
+    version = counter['version'] if counter else None
+    yield 'unread', max(counter['unread'], 0) if counter else 0
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        counter = _counter(db, user_id)
+        if not counter or counter['version'] == version:
+            continue
+        version = counter['version']
+
+        query = {'user_id': user_id}
+        if last_id is not None:
+            query['_id'] = {'$gt': last_id}
+        for notification in db.notifications.find(query).sort('_id', ASCENDING).limit(CHANGES_BATCH_SIZE):
+            last_id = notification['_id']
+            yield 'notification', notification
+        yield 'unread', max(counter['unread'], 0)
+
+
+def rebuild_counters(db):
+    unread = {
+        row['_id']: row['unread']
+        for row in db.notifications.aggregate([
+            {'$match': {'read': False}},
+            {'$group': {'_id': '$user_id', 'unread': {'$sum': 1}}}
+        ])
+    }
+    now = datetime.utcnow()
+    db.notification_counters.update_many(
+        {'_id': {'$nin': list(unread)}},
+        {'$set': {'unread': 0, 'updated_at': now}, '$inc': {'version': 1}}
+    )
+    for user_id, count in unread.items():
+        db.notification_counters.update_one(
+            {'_id': user_id},
+            {'$set': {'unread': count, 'updated_at': now}, '$inc': {'version': 1}},
+            upsert=True
+        )
+    return len(unread)
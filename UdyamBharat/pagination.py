@@ -0,0 +1,91 @@
+import base64
+import json
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+_EPOCH = datetime(1970, 1, 1)
+# Sort values a cursor may carry besides datetimes. Anything else, such as
+# a dict holding a query operator, is rejected.
+_RAW_TYPES = (str, int, float, bool, type(None))
+
+
+def page_size(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    try:
+        size = int(raw)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, maximum))
+
+
+def _encode_value(value):
+    # MongoDB stores datetimes with millisecond precision, so milliseconds
+    # round-trip exactly
+    if isinstance(value, datetime):
+        delta = value.replace(tzinfo=None) - _EPOCH
+        return {'t': 'dt', 'v': delta // timedelta(milliseconds=1)}
+    return {'t': 'raw', 'v': value}
+
+
+def _decode_value(encoded):
+    if encoded['t'] == 'dt':
+        return _EPOCH + timedelta(milliseconds=int(encoded['v']))
+    if encoded['t'] != 'raw' or not isinstance(encoded['v'], _RAW_TYPES):
+        raise ValueError('Invalid cursor value')
+    return encoded['v']
+
+
+def encode_cursor(doc, sort_field):
+    payload = {
+        'k': _encode_value(doc.get(sort_field)),
+        'id': str(doc['_id'])
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    # Raises ValueError for anything that was not produced by encode_cursor
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return _decode_value(payload['k']), ObjectId(payload['id'])
+    except (KeyError, TypeError, ValueError, OverflowError, InvalidId) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def keyset_filter(sort_field, cursor, direction=-1):
+    # Everything strictly after (value, _id) in (sort_field, _id) order
+    value, last_id = cursor
+    op = '$lt' if direction < 0 else '$gt'
+    if value is None:
+        return {sort_field: None, '_id': {op: last_id}}
+    return {'$or': [
+        {sort_field: {op: value}},
+        {sort_field: value, '_id': {op: last_id}}
+    ]}
+
+
+def paginate(collection, query, sort_field, cursor_token=None, limit=DEFAULT_PAGE_SIZE,
+             projection=None, direction=-1):
+    # Returns (documents, next_cursor). One extra document is fetched to
+    # decide whether another page exists.
+    if cursor_token:
+        cursor = decode_cursor(cursor_token)
+        query = {'$and': [query, keyset_filter(sort_field, cursor, direction)]} if query else \
+            keyset_filter(sort_field, cursor, direction)
+
+    docs = list(
+        collection.find(query, projection)
+        .sort([(sort_field, direction), ('_id', direction)])
+        .limit(limit + 1)
+    )
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return docs, next_cursor
@@ -0,0 +1,106 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from flask import current_app
+from werkzeug.local import LocalProxy
+from database import db
+from metrics import metrics
+
+# bcrypt is slow on purpose, so a burst of logins could otherwise keep
+# every request thread busy hashing and stall unrelated requests. Hashes
+# and checks run on PASSWORD_HASH_WORKERS threads per process (bcrypt
+# releases the GIL, so other requests keep running meanwhile), and at
+# most PASSWORD_HASH_MAX_QUEUE more may wait for one; beyond that the
+# caller gets HashingBusy and should ask the user to retry.
+#
+# New hashes use BCRYPT_ROUNDS. A stored hash with a different cost is
+# replaced at the user's next successful login, in the background, so
+# changing BCRYPT_ROUNDS takes effect as users sign in.
+# `python benchmark.py login --bcrypt-rounds 10 12` compares costs.
+
+# Shown by login and registration when every hashing thread is busy
+PASSWORD_BUSY_MESSAGE = 'Too many people are signing in right now. Please try again in a moment.'
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def cost(hashed):
+    # Cost factor of a bcrypt hash, e.g. 12 for b'$2b$12$...'
+    return int(hashed.split(b'$')[2])
+
+
+class PasswordHasher:
+    def __init__(self, app):
+        self.app = app
+        self.rounds = app.config['BCRYPT_ROUNDS']
+        max_workers = app.config['PASSWORD_HASH_WORKERS']
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='bcrypt')
+        # Running plus waiting hashes, including background rehashes
+        self._slots = threading.BoundedSemaphore(max_workers + app.config['PASSWORD_HASH_MAX_QUEUE'])
+
+    def _acquire(self, operation):
+        if not self._slots.acquire(blocking=False):
+            metrics.password_hash_rejected(operation)
+            return False
+        metrics.password_queue_changed(1)
+        return True
+
+    def _release(self):
+        self._slots.release()
+        metrics.password_queue_changed(-1)
+
+    def _run(self, operation, function, *args):
+        if not self._acquire(operation):
+            raise HashingBusy()
+        try:
+            # Includes the wait for a thread, which is what a login feels
+            with metrics.password_hash(operation):
+                return self._executor.submit(function, *args).result()
+        finally:
+            self._release()
+
+    def hash(self, password):
+        return self._run('hash', bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+
+    def check(self, password, hashed):
+        return self._run('check', bcrypt.checkpw, password.encode('utf-8'), hashed)
+
+    def needs_rehash(self, hashed):
+        return cost(hashed) != self.rounds
+
+    def rehash_later(self, user_id, password, hashed):
+        # Stores password at the current cost once a thread is free. When
+        # the queue is full it is skipped and tried at the next login.
+        if not self._acquire('rehash'):
+            return
+
+        def rehash():
+            try:
+                with metrics.password_hash('rehash'):
+                    new_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+                with self.app.app_context():
+                    # Matching the old hash leaves a password changed in
+                    # the meantime alone
+                    db.users.update_one({'_id': user_id, 'password': hashed}, {'$set': {'password': new_hash}})
+            except Exception as e:
+                print(f"Password rehash error: {str(e)}")
+            finally:
+                self._release()
+
+        try:
+            self._executor.submit(rehash)
+        except Exception:
+            self._release()
+            raise
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+def init_app(app):
+    app.extensions['passwords'] = PasswordHasher(app)
+
+
+password_hasher = LocalProxy(lambda: current_app.extensions['passwords'])
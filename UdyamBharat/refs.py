@@ -0,0 +1,54 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+
+# References to users, products and orders are stored as ObjectIds.
+# Earlier code wrote some of them as the 24-character hex string that
+# Flask-Login uses for current_user.id, so one field could hold either
+# type and an equality query on it matched only part of the rows.
+#
+# Documents go through normalize() before they are written and queries
+# wrap ids in ref(), so each field holds one type and its index answers
+# the query directly. On the way out, the app's JSON provider (bson_json.py)
+# writes ObjectIds as hex strings.
+# Documents written before this are rewritten by migrate_ids.py.
+
+# Dotted paths descend into arrays of subdocuments
+REFERENCE_FIELDS = {
+    'products': ('seller_id',),
+    'orders': ('buyer_id', 'seller_id', 'product_id'),
+    'cart': ('user_id', 'buyer_id', 'product_id', 'items.product_id'),
+    'checkouts': ('buyer_id',),
+    'jobs': ('seller_id',),
+    'notifications': ('user_id', 'order_id'),
+    'transcriptions': ('user_id',),
+    'imports': ('seller_id',),
+}
+
+
+def ref(value):
+    # Returns value as an ObjectId; raises ValueError if it is not one
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise ValueError(f'Invalid id: {value!r}')
+
+
+def _normalize_path(doc, parts):
+    if not isinstance(doc, dict) or parts[0] not in doc:
+        return
+    if len(parts) == 1:
+        if doc[parts[0]] is not None:
+            doc[parts[0]] = ref(doc[parts[0]])
+        return
+    value = doc[parts[0]]
+    for item in value if isinstance(value, list) else [value]:
+        _normalize_path(item, parts[1:])
+
+
+def normalize(collection, doc):
+    # Converts doc's reference fields in place and returns it
+    for path in REFERENCE_FIELDS[collection]:
+        _normalize_path(doc, path.split('.'))
+    return doc
@@ -0,0 +1,149 @@
+import sys
+from datetime import datetime
+from pymongo import UpdateOne
+from lookups import products_by_id
+from refs import ref
+
+# One document per seller in seller_stats holds everything the dashboard
+# summarises:
+#   {_id: seller_id, products, jobs, orders: {<status>: count},
+#    revenue, recent_orders: [newest first, at most RECENT_ORDERS]}
+# Each write that changes one of these figures updates the document in
+# place with $inc and $push/$slice, so the dashboard reads one document
+# instead of every product, job and order. A checkout sends the updates
+# for all of its sellers in one bulk_write. rebuild() recomputes the
+# document from the source collections
+# (`python seller_stats.py [seller_id ...]`).
+
+RECENT_ORDERS = 5
+ORDER_STATUSES = ('pending', 'processing', 'completed')
+
+
+def _key(seller_id):
+    return ref(seller_id)
+
+
+def _summary(order, product_name):
+    return {
+        '_id': order['_id'],
+        'product_id': order['product_id'],
+        'product_name': product_name,
+        'quantity': order['quantity'],
+        'total_price': order.get('total_price', 0),
+        'status': order['status'],
+        'created_at': order['created_at']
+    }
+
+
+def _stamped(update):
+    update.setdefault('$set', {})['updated_at'] = datetime.utcnow()
+    return update
+
+
+def _update(db, seller_id, update, session=None, **kwargs):
+    db.seller_stats.update_one({'_id': _key(seller_id)}, _stamped(update), upsert=True, session=session, **kwargs)
+
+
+def adjust_products(db, seller_id, delta, session=None):
+    _update(db, seller_id, {'$inc': {'products': delta}}, session)
+
+
+def adjust_jobs(db, seller_id, delta, session=None):
+    _update(db, seller_id, {'$inc': {'jobs': delta}}, session)
+
+
+def orders_placed(db, orders, product_names, session=None):
+    # orders: newly inserted order documents, possibly for several sellers;
+    # product_names: {str(product_id): name}
+    by_seller = {}
+    for order in orders:
+        by_seller.setdefault(_key(order['seller_id']), []).append(order)
+
+    operations = []
+    for seller_id, seller_orders in by_seller.items():
+        increments = {'revenue': sum(order.get('total_price', 0) for order in seller_orders)}
+        for order in seller_orders:
+            field = f"orders.{order['status']}"
+            increments[field] = increments.get(field, 0) + 1
+
+        newest_first = sorted(seller_orders, key=lambda order: order['created_at'], reverse=True)
+        operations.append(UpdateOne({'_id': seller_id}, _stamped({
+            '$inc': increments,
+            '$push': {'recent_orders': {
+                '$each': [_summary(order, product_names.get(str(order['product_id']))) for order in newest_first],
+                '$position': 0,
+                '$slice': RECENT_ORDERS
+            }}
+        }), upsert=True))
+
+    if operations:
+        db.seller_stats.bulk_write(operations, ordered=False, session=session)
+
+
+def order_status_changed(db, seller_id, order_id, old_status, new_status, session=None):
+    if old_status == new_status:
+        return
+    _update(
+        db,
+        seller_id,
+        {
+            '$inc': {f'orders.{old_status}': -1, f'orders.{new_status}': 1},
+            '$set': {'recent_orders.$[order].status': new_status}
+        },
+        session,
+        array_filters=[{'order._id': order_id}]
+    )
+
+
+def get_stats(db, seller_id):
+    stats = db.seller_stats.find_one({'_id': _key(seller_id)}) or {}
+    return {
+        'products': stats.get('products', 0),
+        'jobs': stats.get('jobs', 0),
+        'orders': {status: stats.get('orders', {}).get(status, 0) for status in ORDER_STATUSES},
+        'revenue': stats.get('revenue', 0),
+        'recent_orders': stats.get('recent_orders', [])
+    }
+
+
+def rebuild(db, seller_ids=None):
+    # Recomputes the documents for the given sellers, or for every seller
+    if seller_ids is None:
+        seller_ids = [user['_id'] for user in db.users.find({'role': 'seller'}, {'_id': 1})]
+
+    for seller_id in seller_ids:
+        match = {'seller_id': _key(seller_id)}
+        orders = {status: 0 for status in ORDER_STATUSES}
+        revenue = 0
+        for row in db.orders.aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}, 'revenue': {'$sum': '$total_price'}}}
+        ]):
+            orders[row['_id']] = row['count']
+            revenue += row['revenue']
+
+        recent = list(db.orders.find(match).sort('created_at', -1).limit(RECENT_ORDERS))
+        products = products_by_id(db, (order['product_id'] for order in recent), ['name'])
+
+        db.seller_stats.replace_one({'_id': _key(seller_id)}, {
+            'products': db.products.count_documents(match),
+            'jobs': db.jobs.count_documents(match),
+            'orders': orders,
+            'revenue': revenue,
+            'recent_orders': [
+                _summary(order, products.get(str(order['product_id']), {}).get('name'))
+                for order in recent
+            ],
+            'updated_at': datetime.utcnow()
+        }, upsert=True)
+
+    return len(seller_ids)
+
+
+if __name__ == '__main__':
+    from app import app
+    from database import get_db
+
+    with app.app_context():
+        count = rebuild(get_db(), sys.argv[1:] or None)
+    print(f"Rebuilt dashboard stats for {count} sellers")
@@ -14,6 +14,7 @@ document.addEventListener('DOMContentLoaded', () => {
     initializeVoiceInput();
     loadCart();
     setupEventListeners();
+    subscribeToNotifications();
 });
 
 // Voice Input Setup
@@ -52,16 +53,7 @@ function initializeVoiceInput() {
                     formData.append('language', language);
                     
                     try {
-                        const response = await fetch('/api/voice/transcribe', {
-                            method: 'POST',
-                            body: formData
-                        });
-                        
-                        if (!response.ok) {
-                            throw new Error('Transcription failed');
-                        }
-                        
-                        const data = await response.json();
+                        const data = await transcribeAudio(formData);
                         if (data.transcript) {
                             targetInput.value = data.transcript;
                             // Trigger input event to ensure form validation
@@ -107,6 +99,37 @@ function initializeVoiceInput() {
     });
 }
 
+// Submit audio as a transcription job and poll until it finishes
+async function transcribeAudio(formData) {
+    const response = await fetch('/api/voice/transcribe/jobs', {
+        method: 'POST',
+        body: formData
+    });
+    
+    if (!response.ok) {
+        throw new Error('Transcription failed');
+    }
+    
+    const job = await response.json();
+    const deadline = Date.now() + 120000;
+    while (Date.now() < deadline) {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(job.status_url);
+        if (!statusResponse.ok) {
+            throw new Error('Transcription failed');
+        }
+        
+        const status = await statusResponse.json();
+        if (status.status === 'completed') {
+            return status;
+        }
+        if (status.status === 'failed') {
+            throw new Error(status.error || 'Transcription failed');
+        }
+    }
+    throw new Error('Transcription timed out');
+}
+
 // Event Listeners Setup
 function setupEventListeners() {
     // Search functionality
@@ -181,8 +204,8 @@ async function loadCart() {
     try {
         const response = await fetch('/api/cart');
         if (response.ok) {
-            const items = await response.json();
-            updateCartDisplay(items);
+            const data = await response.json();
+            updateCartDisplay(data.items);
         }
     } catch (error) {
         showNotification('Error loading cart', 'error');
@@ -210,11 +233,27 @@ function updateCartDisplay(items) {
     cartTotal.textContent = total;
 }
 
+// Reused when a checkout request fails without a response, so a retry
+// after a timeout cannot place the same orders twice
+let checkoutKey = null;
+
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+}
+
 async function handleCheckout() {
+    checkoutKey = checkoutKey || newIdempotencyKey();
     try {
         const response = await fetch('/api/checkout', {
-            method: 'POST'
+            method: 'POST',
+            headers: {
+                'Idempotency-Key': checkoutKey
+            }
         });
+        checkoutKey = null;
         
         if (response.ok) {
             showNotification('Order placed successfully!', 'success');
@@ -228,6 +267,42 @@ async function handleCheckout() {
     }
 }
 
+// Notifications: keep any [data-notification-count] badge current without
+// reloading the page. By default the unread count is polled (skipped while
+// the tab is hidden); when the server sets NOTIFICATION_UPDATES to
+// 'events', new notifications are pushed and shown as they arrive.
+function subscribeToNotifications() {
+    const badges = document.querySelectorAll('[data-notification-count]');
+    if (!badges.length) return;
+    
+    const showUnread = unread => {
+        badges.forEach(badge => {
+            badge.textContent = unread;
+            badge.hidden = unread === 0;
+        });
+    };
+    const { notificationUpdates, pollInterval } = badges[0].dataset;
+    
+    if (notificationUpdates === 'events' && window.EventSource) {
+        const events = new EventSource('/api/notifications/events');
+        events.addEventListener('unread', event => showUnread(JSON.parse(event.data).unread));
+        events.addEventListener('notification', event => {
+            showNotification(JSON.parse(event.data).message, 'info');
+        });
+        return;
+    }
+    
+    setInterval(async () => {
+        if (document.hidden) return;
+        try {
+            const response = await fetch('/api/notifications/unread_count');
+            if (response.ok) showUnread((await response.json()).unread);
+        } catch (error) {
+            // Try again at the next interval
+        }
+    }, Number(pollInterval) * 1000);
+}
+
 // Utility Functions
 function showNotification(message, type = 'info') {
     const notification = document.createElement('div');
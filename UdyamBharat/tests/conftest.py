@@ -0,0 +1,88 @@
+import collections
+import os
+import sys
+import threading
+import time
+from bson import ObjectId
+import mongomock
+import pytest
+
+# Tests run against mongomock, so they need no MongoDB server. app.py
+# builds an app when imported, which needs a SECRET_KEY.
+os.environ.setdefault('SECRET_KEY', 'test')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import benchmark
+import checkout
+import database
+
+
+@pytest.fixture
+def mongo():
+    client = mongomock.MongoClient()
+    # mongomock has no transactions
+    checkout._transaction_support[id(client)] = False
+    yield client
+    checkout._transaction_support.pop(id(client), None)
+
+
+@pytest.fixture
+def db(mongo):
+    return mongo['udyambharat_test']
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    # Counts (collection, method) for each command a real server would see,
+    # like benchmark.in_memory_client_factory. Calls mongomock makes to its
+    # own methods (find_one calls find) are not counted again.
+    counts = collections.Counter()
+    local = threading.local()
+
+    def counted(name, method):
+        def wrapper(self, *args, **kwargs):
+            if getattr(local, 'active', False):
+                return method(self, *args, **kwargs)
+            counts[(self.name, name)] += 1
+            local.active = True
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                local.active = False
+        return wrapper
+
+    for name in benchmark.MONGOMOCK_COMMANDS:
+        monkeypatch.setattr(mongomock.Collection, name, counted(name, getattr(mongomock.Collection, name)))
+    return counts
+
+
+@pytest.fixture
+def app(mongo):
+    from app import create_app
+
+    app = create_app('testing')
+    database.init_app(app, lambda config: mongo)
+    yield app
+    for name in ('transcription', 'imports', 'passwords'):
+        app.extensions[name].shutdown()
+
+
+@pytest.fixture
+def login(app, db):
+    # login(role) -> (test client signed in as a new user, user id)
+    def login(role='buyer'):
+        user_id = ObjectId()
+        db.users.insert_one({'_id': user_id, 'name': 'Test', 'email': f'{user_id}@test.local', 'role': role})
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        return client, user_id
+    return login
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
@@ -0,0 +1,46 @@
+import os
+import sqlite3
+from datetime import datetime
+from bson import ObjectId
+import pytest
+from cache import MISSING, SQLiteCache, create_cache
+
+
+def test_sqlite_cache_round_trips_documents(tmp_path):
+    cache = SQLiteCache(str(tmp_path / 'cache.sqlite3'))
+    product = {'_id': ObjectId(), 'name': 'Shawl', 'price': 1200.5, 'created_at': datetime(2024, 5, 1, 10, 30)}
+    cache.set('products:detail', product)
+    cache.set('users:1', ('1', 'a@b.c', 'buyer', 'A'))
+
+    assert cache.get('products:detail') == product
+    assert cache.get('users:1') == ['1', 'a@b.c', 'buyer', 'A']
+    assert cache.get('absent') is MISSING
+
+
+def test_sqlite_cache_file_is_private(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    SQLiteCache(path)
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+def test_sqlite_cache_refuses_a_file_others_can_write(tmp_path):
+    path = tmp_path / 'cache.sqlite3'
+    path.touch()
+    path.chmod(0o666)
+    with pytest.raises(ValueError, match='writable by other users'):
+        SQLiteCache(str(path))
+
+
+def test_sqlite_cache_ignores_values_it_cannot_decode(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = SQLiteCache(path)
+    cache.set('key', 'value')
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE cache SET value = ?", (b'\x80\x04pickled',))
+
+    assert cache.get('key') is MISSING
+
+
+def test_sqlite_backend_needs_a_path():
+    with pytest.raises(ValueError, match='needs a path'):
+        create_cache('sqlite', name='catalog')
@@ -0,0 +1,74 @@
+import threading
+from bson import ObjectId
+import mongomock
+import pytest
+from cart import add_item, get_cart
+
+THREADS = 8
+ADDS = 5
+
+
+@pytest.fixture
+def atomic_updates(monkeypatch):
+    # A server applies each update to a document atomically; mongomock
+    # does not, so updates are serialized here. add_item must still not
+    # lose items to a read-modify-write in Python.
+    lock = threading.RLock()
+    update_one = mongomock.Collection.update_one
+
+    def locked(self, *args, **kwargs):
+        with lock:
+            return update_one(self, *args, **kwargs)
+    monkeypatch.setattr(mongomock.Collection, 'update_one', locked)
+
+
+def run_parallel(target, count):
+    barrier = threading.Barrier(count)
+    errors = []
+
+    def run(index):
+        try:
+            barrier.wait()
+            target(index)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+
+
+def quantities(db, buyer_id):
+    return {item['product_id']: item['quantity'] for item in get_cart(db, buyer_id)['items']}
+
+
+def test_parallel_adds_of_one_product_are_summed(db, atomic_updates):
+    db.cart.create_index('buyer_id', unique=True)
+    buyer_id, product_id = ObjectId(), ObjectId()
+
+    def add(index):
+        for _ in range(ADDS):
+            add_item(db, buyer_id, product_id, 2)
+    run_parallel(add, THREADS)
+
+    assert db.cart.count_documents({'buyer_id': buyer_id}) == 1
+    assert quantities(db, buyer_id) == {product_id: THREADS * ADDS * 2}
+
+
+def test_parallel_adds_of_different_products_are_all_kept(db, atomic_updates):
+    db.cart.create_index('buyer_id', unique=True)
+    buyer_id = ObjectId()
+    product_ids = [ObjectId() for _ in range(THREADS)]
+
+    def add(index):
+        for _ in range(ADDS):
+            add_item(db, buyer_id, product_ids[index], 1)
+            add_item(db, buyer_id, product_ids[0], 1)
+    run_parallel(add, THREADS)
+
+    expected = {product_id: ADDS for product_id in product_ids}
+    expected[product_ids[0]] += THREADS * ADDS
+    assert quantities(db, buyer_id) == expected
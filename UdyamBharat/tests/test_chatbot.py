@@ -0,0 +1,122 @@
+import json
+import pytest
+import chatbot
+from chatbot import BUSY_MESSAGE, ChatbotBusy
+
+
+class FakeText:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeClient:
+    # Stands in for the Gemini client; counts calls per method
+    def __init__(self):
+        self.models = self
+        self.calls = []
+
+        # Set to make the model return nothing, as when an answer is blocked
+        self.empty = False
+
+    def generate_content(self, model, contents):
+        self.calls.append(('generate_content', contents))
+        return FakeText(None if self.empty else f'Answer to: {contents}')
+
+    def generate_content_stream(self, model, contents):
+        self.calls.append(('generate_content_stream', contents))
+        if self.empty:
+            yield FakeText(None)
+            return
+        for word in f'Answer to: {contents}'.split():
+            yield FakeText(word + ' ')
+
+
+@pytest.fixture
+def fake(app):
+    # One call at a time, and a short wait for it, with an LRU cache
+    app.config['CHATBOT_MAX_IN_FLIGHT'] = 1
+    app.config['CHATBOT_ACQUIRE_TIMEOUT'] = 0.05
+    app.config['CHATBOT_CACHE_BACKEND'] = 'lru'
+    client = FakeClient()
+    chatbot.init_app(app, lambda: client)
+    return client
+
+
+def stream(client, message):
+    return client.post('/api/chatbot/stream', json={'message': message})
+
+
+def streamed_text(response):
+    return ''.join(
+        json.loads(line[len('data: '):])['text']
+        for line in response.get_data(as_text=True).splitlines()
+        if line.startswith('data: {"text"')
+    )
+
+
+def test_repeated_question_is_answered_from_the_cache(app, fake):
+    client = app.test_client()
+    first = client.post('/api/chatbot', json={'message': 'What is  pashmina?'}).get_json()
+    second = client.post('/api/chatbot', json={'message': ' What is pashmina? '}).get_json()
+    assert first == second == {'success': True, 'message': 'Answer to: What is  pashmina?'}
+
+    assert streamed_text(stream(client, 'What is pashmina?')) == 'Answer to: What is  pashmina?'
+    assert fake.calls == [('generate_content', 'What is  pashmina?')]
+
+
+def test_streamed_answer_is_cached(app, fake):
+    client = app.test_client()
+    assert streamed_text(stream(client, 'Hello')) == 'Answer to: Hello '
+    assert streamed_text(stream(client, 'Hello')) == 'Answer to: Hello '
+    assert fake.calls == [('generate_content_stream', 'Hello')]
+
+
+def test_empty_answers_are_not_cached(app, fake):
+    fake.empty = True
+    with app.app_context():
+        service = chatbot.chatbot_service
+        assert service.respond('Hello') is None
+        assert ''.join(service.stream('Hello')) == ''
+
+        fake.empty = False
+        assert service.respond('Hello') == 'Answer to: Hello'
+        assert ''.join(service.stream('Hello')) == 'Answer to: Hello'
+    assert fake.calls == [
+        ('generate_content', 'Hello'),
+        ('generate_content_stream', 'Hello'),
+        ('generate_content', 'Hello')
+    ]
+
+
+def test_stream_is_503_when_every_slot_is_taken(app, fake):
+    with app.app_context():
+        held = chatbot.chatbot_service.stream('first')
+
+        response = stream(app.test_client(), 'second')
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '5'
+        assert response.get_json() == {'success': False, 'message': BUSY_MESSAGE}
+
+        held.close()
+    assert stream(app.test_client(), 'second').status_code == 200
+
+
+def test_closing_a_stream_early_releases_its_slot(app, fake):
+    with app.app_context():
+        service = chatbot.chatbot_service
+        chunks = service.stream('first')
+        assert next(chunks) == 'Answer '
+        with pytest.raises(ChatbotBusy):
+            service.stream('second')
+
+        chunks.close()
+        assert ''.join(service.stream('second')) == 'Answer to: second '
+
+
+def test_client_disconnect_releases_the_slot(app, fake):
+    client = app.test_client()
+    response = client.post('/api/chatbot/stream', json={'message': 'first'}, buffered=False)
+    assert next(response.response).startswith(b'data: ')
+    response.close()
+
+    assert stream(client, 'second').status_code == 200
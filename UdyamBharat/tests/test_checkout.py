@@ -0,0 +1,57 @@
+from bson import ObjectId
+import pytest
+import cart
+from checkout import process_checkout
+from notifications import unread_count
+from seller_stats import get_stats
+
+
+def fill_cart(db, buyer_id, sellers):
+    # One product per seller, two of each in the cart
+    seller_ids = [ObjectId() for _ in range(sellers)]
+    for i, seller_id in enumerate(seller_ids):
+        product_id = db.products.insert_one({'name': f'Product {i}', 'price': 100, 'seller_id': seller_id}).inserted_id
+        cart.add_item(db, buyer_id, product_id, 2)
+    return seller_ids
+
+
+@pytest.mark.parametrize('sellers', [2, 5])
+def test_checkout_round_trips_do_not_grow_with_sellers(mongo, db, commands, sellers):
+    buyer_id = ObjectId()
+    seller_ids = fill_cart(db, buyer_id, sellers)
+    commands.clear()
+
+    result, replayed = process_checkout(mongo, db, buyer_id)
+
+    assert not replayed
+    assert len(result['order_ids']) == sellers
+    assert result['total'] == 200 * sellers
+    assert commands == {
+        ('cart', 'find_one'): 1,
+        ('products', 'find'): 1,
+        ('orders', 'insert_many'): 1,
+        ('notifications', 'insert_many'): 1,
+        ('notification_counters', 'bulk_write'): 1,
+        ('notification_counters', 'find'): 1,
+        ('seller_stats', 'bulk_write'): 1,
+        ('cart', 'update_one'): 1
+    }
+    for seller_id in seller_ids:
+        stats = get_stats(db, seller_id)
+        assert stats['revenue'] == 200
+        assert stats['orders']['pending'] == 1
+        assert [order['quantity'] for order in stats['recent_orders']] == [2]
+        assert unread_count(db, seller_id) == 1
+
+
+def test_single_seller_checkout_updates_its_counter_in_place(mongo, db, commands):
+    buyer_id = ObjectId()
+    [seller_id] = fill_cart(db, buyer_id, 1)
+    commands.clear()
+
+    process_checkout(mongo, db, buyer_id)
+
+    assert commands[('notification_counters', 'find_one_and_update')] == 1
+    assert ('notification_counters', 'bulk_write') not in commands
+    assert unread_count(db, seller_id) == 1
+    assert get_stats(db, seller_id)['revenue'] == 200
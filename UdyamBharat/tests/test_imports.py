@@ -0,0 +1,125 @@
+import csv
+import hashlib
+import io
+import threading
+import zipfile
+import pytest
+import imports
+from conftest import wait_for
+from images import InvalidImage
+from imports import TERMINAL_STATUSES
+
+
+class FakeImages:
+    # Stands in for the image pipeline: every photo is already rendered.
+    # Clearing gate holds the import at its first photo.
+    def __init__(self):
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def submit(self, data):
+        self.gate.wait(5)
+        if data == b'not an image':
+            raise InvalidImage()
+        digest = hashlib.sha256(data).hexdigest()
+        return digest, {'card': {'jpeg': f'/static/uploads/{digest}.jpg'}}, None
+
+    def mark_when_done(self, digest, future):
+        pass
+
+
+@pytest.fixture
+def seller(app, login):
+    app.config['IMPORT_BATCH_SIZE'] = 2
+    app.extensions['images'] = FakeImages()
+    imports.init_app(app)
+    return login('seller')
+
+
+def upload(client, rows, photos):
+    text = io.StringIO()
+    writer = csv.writer(text)
+    writer.writerows(rows)
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w') as zf:
+        for name, data in photos.items():
+            zf.writestr(name, data)
+    return client.post('/api/products/import', data={
+        'csv': (io.BytesIO(text.getvalue().encode()), 'products.csv'),
+        'images': (io.BytesIO(archive.getvalue()), 'photos.zip')
+    })
+
+
+def finished(client, response):
+    assert response.status_code == 202
+    url = response.get_json()['status_url']
+    wait_for(lambda: client.get(url).get_json()['status'] in TERMINAL_STATUSES)
+    return client.get(url).get_json()
+
+
+def test_import_writes_valid_rows_and_reports_the_rest(db, seller):
+    client, seller_id = seller
+    response = upload(client, [
+        ['Name', 'Price', 'Image', 'District'],
+        ['Shawl', '1200', 'shawl.jpg', 'Leh'],
+        ['Basket', 'abc', 'basket.jpg', 'Jammu'],
+        ['Rug', '3000', 'rug.jpg', 'Kathua'],
+        ['Pot', '150', 'pot.jpg', 'Doda'],
+        ['Lamp', '400', 'missing.jpg', 'Samba'],
+        ['Cap', '90', 'bad.jpg', 'Reasi']
+    ], {
+        'shawl.jpg': b'shawl',
+        'basket.jpg': b'basket',
+        'photos/rug.jpg': b'rug',
+        'pot.jpg': b'pot',
+        'bad.jpg': b'not an image'
+    })
+
+    job = finished(client, response)
+    assert job['status'] == 'completed'
+    assert (job['total'], job['processed'], job['imported'], job['failed']) == (6, 6, 3, 3)
+    assert job['errors'] == [
+        {'line': 3, 'error': 'price must be a number'},
+        {'line': 6, 'error': 'missing.jpg is not in the zip file'},
+        {'line': 7, 'error': 'bad.jpg is not a valid image'}
+    ]
+    assert sorted(db.products.distinct('name', {'seller_id': seller_id})) == ['Pot', 'Rug', 'Shawl']
+    assert db.seller_stats.find_one({'_id': seller_id})['products'] == 3
+
+
+def test_import_without_required_columns_fails(seller):
+    client, _ = seller
+    job = finished(client, upload(client, [['title', 'cost'], ['Shawl', '1200']], {}))
+    assert job['status'] == 'failed'
+    assert job['error'] == 'CSV is missing columns: name, price, image'
+
+
+def test_archive_must_be_a_zip_file(db, seller):
+    client, _ = seller
+    response = client.post('/api/products/import', data={
+        'csv': (io.BytesIO(b'name,price,image\n'), 'products.csv'),
+        'images': (io.BytesIO(b'not a zip'), 'photos.zip')
+    })
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Images must be uploaded as a zip file'}
+    assert db.imports.count_documents({}) == 0
+
+
+def test_import_is_refused_when_the_queue_is_full(app, db, seller):
+    app.config['IMPORT_WORKERS'] = 1
+    app.config['IMPORT_MAX_QUEUE'] = 0
+    imports.init_app(app)
+    client, _ = seller
+    images = app.extensions['images']
+    images.gate.clear()
+    rows = [['name', 'price', 'image'], ['Shawl', '1200', 'shawl.jpg']]
+    first = upload(client, rows, {'shawl.jpg': b'shawl'})
+    wait_for(lambda: db.imports.find_one()['status'] == 'running')
+
+    response = upload(client, rows, {'shawl.jpg': b'shawl'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '30'
+
+    images.gate.set()
+    assert finished(client, first)['imported'] == 1
+    assert finished(client, upload(client, rows, {'shawl.jpg': b'shawl'}))['imported'] == 1
@@ -0,0 +1,45 @@
+from bson import ObjectId
+import pytest
+from lookups import attach_product_names, products_by_id
+
+
+def seed(db, count):
+    products = [{'name': f'Product {i}', 'price': 100} for i in range(count)]
+    db.products.insert_many(products)
+    return [{
+        '_id': ObjectId(),
+        'product_id': product['_id'],
+        'quantity': 1
+    } for product in products]
+
+
+@pytest.mark.parametrize('count', [1, 25])
+def test_attach_product_names_is_one_query(db, commands, count):
+    orders = seed(db, count)
+    commands.clear()
+
+    named = attach_product_names(db, orders)
+
+    assert [order['product_name'] for order in named] == [f'Product {i}' for i in range(count)]
+    assert commands == {('products', 'find'): 1}
+
+
+def test_attach_product_names_skips_deleted_products(db, commands):
+    orders = seed(db, 2)
+    db.products.delete_one({'_id': orders[1]['product_id']})
+    commands.clear()
+
+    named = attach_product_names(db, orders)
+
+    assert named[0]['product_name'] == 'Product 0'
+    assert 'product_name' not in named[1]
+    assert commands == {('products', 'find'): 1}
+
+
+def test_products_by_id_accepts_string_ids(db):
+    product_id = db.products.insert_one({'name': 'Shawl'}).inserted_id
+
+    products = products_by_id(db, [str(product_id), product_id, 'not-an-id', None], ['name'])
+
+    assert list(products) == [str(product_id)]
+    assert products[str(product_id)]['name'] == 'Shawl'
@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.mark.parametrize('path', ['/metrics', '/api/cache/stats'])
+def test_operational_endpoints_need_the_token(app, path):
+    app.config['METRICS_TOKEN'] = 'secret'
+    client = app.test_client()
+
+    assert client.get(path).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.get(path, headers={'Authorization': 'Bearer secret'}).status_code == 200
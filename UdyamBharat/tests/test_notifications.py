@@ -0,0 +1,34 @@
+from notifications import notify
+
+
+def test_unread_count_endpoint(db, login):
+    client, user_id = login()
+    notify(db, [{'user_id': user_id, 'message': 'Order shipped'}, {'user_id': user_id, 'message': 'Order delivered'}])
+
+    assert client.get('/api/notifications/unread_count').get_json() == {'unread': 2}
+
+
+def test_event_stream_is_off_unless_enabled(app, login):
+    client, _ = login()
+    response = client.get('/api/notifications/events')
+    assert response.status_code == 204
+    assert response.get_data() == b''
+
+
+def test_dashboard_badge_polls_by_default(app, login):
+    client, _ = login()
+    page = client.get('/buyer/dashboard').get_data(as_text=True)
+    assert 'data-notification-updates="poll"' in page
+    assert 'data-poll-interval="30"' in page
+
+
+def test_event_stream_when_enabled(app, db, login):
+    app.config['NOTIFICATION_UPDATES'] = 'events'
+    client, user_id = login()
+    notify(db, [{'user_id': user_id, 'message': 'Order shipped'}])
+
+    response = client.get('/api/notifications/events', buffered=False)
+    chunks = iter(response.response)
+    assert next(chunks) == b'retry: 3000\n\n'
+    assert next(chunks) == b'event: unread\ndata: {"unread": 1}\n\n'
+    response.close()
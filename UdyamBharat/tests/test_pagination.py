@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+import pytest
+from pagination import decode_cursor, encode_cursor
+
+
+def token(payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+@pytest.mark.parametrize('value', ['Shawl', 1200, 12.5, True, None, datetime(2024, 5, 1, 10, 30, 0, 123000)])
+def test_cursor_round_trips(value):
+    _id = ObjectId()
+    assert decode_cursor(encode_cursor({'_id': _id, 'k': value}, 'k')) == (value, _id)
+
+
+@pytest.mark.parametrize('key', [
+    {'t': 'dt', 'v': 10 ** 20},
+    {'t': 'dt', 'v': 'soon'},
+    {'t': 'raw', 'v': {'$ne': None}},
+    {'t': 'raw', 'v': ['a']},
+    {'t': 'other', 'v': 1},
+    'raw'
+])
+def test_crafted_cursor_is_invalid(key):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(token({'k': key, 'id': str(ObjectId())}))
+
+
+@pytest.mark.parametrize('raw', ['not base64!', token({'k': {'t': 'raw', 'v': 1}, 'id': 'x'}), token([1])])
+def test_malformed_cursor_is_invalid(raw):
+    with pytest.raises(ValueError, match='Invalid cursor'):
+        decode_cursor(raw)
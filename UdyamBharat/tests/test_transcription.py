@@ -0,0 +1,123 @@
+import io
+import threading
+from bson import ObjectId
+import pytest
+import transcription
+from conftest import wait_for
+from transcription import TranscriptionBusy
+
+
+class FakeBackend:
+    # Holds each transcription until release() so tests can see it running
+    def __init__(self, error=None):
+        self.error = error
+        self.started = threading.Event()
+        self._release = threading.Event()
+        self.audio = []
+
+    def release(self):
+        self._release.set()
+
+    def __call__(self, audio, language):
+        self.audio.append(audio)
+        self.started.set()
+        self._release.wait(5)
+        if self.error:
+            raise self.error
+        return {'text': f'{audio.read().decode()} ({language})', 'confidence': 0.9}
+
+
+@pytest.fixture
+def backend(app):
+    # One worker and no queue, so a second job is refused while one runs
+    app.config['TRANSCRIPTION_WORKERS'] = 1
+    app.config['TRANSCRIPTION_MAX_QUEUE'] = 0
+    backend = FakeBackend()
+    transcription.init_app(app, backend)
+    yield backend
+    backend.release()
+
+
+def status(db, job_id):
+    return db.transcriptions.find_one({'_id': job_id})['status']
+
+
+def submit(app):
+    with app.app_context():
+        return transcription.transcription_service.submit(io.BytesIO(b'namaste'), 'hi', ObjectId())
+
+
+def test_job_runs_to_completion(app, db, backend):
+    job_id = submit(app)
+    assert backend.started.wait(5)
+    assert status(db, job_id) == 'running'
+    assert not backend.audio[0].closed
+
+    backend.release()
+    wait_for(lambda: status(db, job_id) == 'completed')
+    job = db.transcriptions.find_one({'_id': job_id})
+    assert job['transcript'] == 'namaste (hi)'
+    assert job['confidence'] == 0.9
+    wait_for(lambda: backend.audio[0].closed)
+
+
+def test_failed_job_records_the_error(app, db, backend):
+    backend.error = RuntimeError('no speech found')
+    job_id = submit(app)
+    backend.release()
+
+    wait_for(lambda: status(db, job_id) == 'failed')
+    assert db.transcriptions.find_one({'_id': job_id})['error'] == 'no speech found'
+    wait_for(lambda: backend.audio[0].closed)
+
+
+def test_full_queue_is_refused_until_a_job_finishes(app, db, backend):
+    job_id = submit(app)
+    assert backend.started.wait(5)
+    with pytest.raises(TranscriptionBusy):
+        submit(app)
+
+    backend.release()
+    wait_for(lambda: status(db, job_id) == 'completed')
+    wait_for(lambda: backend.audio[0].closed)
+    submit(app)
+
+
+def test_status_endpoint(app, backend, login):
+    client, _ = login()
+    response = client.post('/api/voice/transcribe/jobs', data={
+        'audio': (io.BytesIO(b'namaste'), 'audio.wav'),
+        'language': 'hi'
+    })
+    assert response.status_code == 202
+    status_url = response.get_json()['status_url']
+
+    assert backend.started.wait(5)
+    assert client.get(status_url).get_json() == {
+        'job_id': response.get_json()['job_id'],
+        'status': 'running',
+        'language': 'hi'
+    }
+
+    backend.release()
+    wait_for(lambda: client.get(status_url).get_json()['status'] == 'completed')
+    data = client.get(status_url).get_json()
+    assert data['transcript'] == 'namaste (hi)'
+    assert data['confidence'] == 0.9
+
+    events = client.get(response.get_json()['events_url']).get_data(as_text=True)
+    assert '"status": "completed"' in events
+
+    # Another user's job is not found
+    other, _ = login()
+    assert other.get(status_url).status_code == 404
+
+
+def test_busy_submission_is_503(app, backend, login):
+    client, _ = login()
+    submit(app)
+    assert backend.started.wait(5)
+
+    response = client.post('/api/voice/transcribe/jobs', data={'audio': (io.BytesIO(b'x'), 'audio.wav')})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '5'
@@ -0,0 +1,108 @@
+from bson import ObjectId
+from flask import current_app
+from werkzeug.local import LocalProxy
+from database import db
+from job_queue import TERMINAL_STATUSES, JobQueue
+from lazy import Lazy
+from metrics import metrics
+from refs import ref
+
+# Voice transcription runs as a job (see job_queue.py): the request only
+# buffers the audio and returns a job id, and a small per-process thread
+# pool talks to AssemblyAI. Job state lives in the transcriptions
+# collection. Audio over TRANSCRIPTION_SPOOL_MAX_BYTES goes to an
+# anonymous temp file; nothing is written under static/.
+
+# Frontend language codes to AssemblyAI language codes
+LANGUAGE_MAP = {
+    'en': 'en',
+    'hi': 'hi',
+    'doi': 'hi'  # Dogri uses Hindi as base language
+}
+
+
+class TranscriptionBusy(Exception):
+    pass
+
+
+def assemblyai_backend(api_key):
+    # Default backend. Any callable taking (audio, language) and returning
+    # {'text': ..., 'confidence': ...} can be passed to init_app instead.
+    # The SDK is imported by the first transcription, not at startup.
+    def load_sdk():
+        import assemblyai
+        assemblyai.settings.api_key = api_key
+        return assemblyai
+
+    sdk = Lazy(load_sdk)
+
+    def transcribe(audio, language):
+        aai = sdk.get()
+        config = aai.TranscriptionConfig(
+            language_code=LANGUAGE_MAP.get(language, 'en'),
+            punctuate=True,
+            format_text=True,
+            audio_format='wav'
+        )
+        transcript = aai.Transcriber(config=config).transcribe(audio)
+        if getattr(transcript, 'error', None):
+            raise RuntimeError(transcript.error)
+        return {'text': transcript.text, 'confidence': transcript.confidence}
+
+    return transcribe
+
+
+class TranscriptionService:
+    def __init__(self, app, backend):
+        self.backend = backend
+        self._jobs = JobQueue(
+            app,
+            'transcribe',
+            'transcriptions',
+            app.config['TRANSCRIPTION_WORKERS'],
+            app.config['TRANSCRIPTION_MAX_QUEUE'],
+            app.config['TRANSCRIPTION_SPOOL_MAX_BYTES'],
+            TranscriptionBusy
+        )
+
+    def submit(self, stream, language, user_id):
+        # Raises TranscriptionBusy when too many jobs are running or waiting
+        def run(job_id, audio):
+            with metrics.external('assemblyai'):
+                result = self.backend(audio, language)
+            return {'transcript': result['text'], 'confidence': result['confidence']}
+
+        return self._jobs.submit([stream], {'user_id': ref(user_id), 'language': language}, run)
+
+    def shutdown(self, wait=True):
+        self._jobs.shutdown(wait=wait)
+
+
+def get_job(job_id, user_id):
+    if not ObjectId.is_valid(job_id):
+        return None
+    return db.transcriptions.find_one({'_id': ObjectId(job_id), 'user_id': ref(user_id)})
+
+
+def serialize_job(job):
+    data = {
+        'job_id': str(job['_id']),
+        'status': job['status'],
+        'language': job['language']
+    }
+    if job['status'] == 'completed':
+        data['transcript'] = job['transcript']
+        data['confidence'] = job['confidence']
+    elif job['status'] == 'failed':
+        data['error'] = job.get('error')
+    return data
+
+
+def init_app(app, backend=None):
+    app.extensions['transcription'] = TranscriptionService(
+        app,
+        backend or assemblyai_backend(app.config['ASSEMBLYAI_API_KEY'])
+    )
+
+
+transcription_service = LocalProxy(lambda: current_app.extensions['transcription'])
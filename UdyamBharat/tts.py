@@ -0,0 +1,166 @@
+import hashlib
+import os
+import tempfile
+import threading
+from flask import current_app
+from werkzeug.local import LocalProxy
+from lazy import Lazy
+from metrics import metrics
+
+# Synthesized speech is stored under the SHA-256 of (model, voice, text),
+# so repeated notifications such as "New order received for X" are
+# synthesized once and then served as static files. Concurrent requests
+# for the same audio within a worker share a single synthesis call. The
+# directory is capped at TTS_CACHE_MAX_BYTES, evicting the least recently
+# used files first; a hit refreshes the file's mtime.
+
+DEFAULT_MODEL = 'eleven_multilingual_v2'
+
+# Frontend language codes to ElevenLabs voices
+VOICE_MAP = {
+    'en': 'Rachel',  # English voice
+    'hi': 'Priya',   # Hindi voice
+    'doi': 'Priya'   # Dogri voice (using Hindi voice as fallback)
+}
+
+
+def speech_key(text, voice, model):
+    return hashlib.sha256(f'{model}\0{voice}\0{text}'.encode('utf-8')).hexdigest()
+
+
+def elevenlabs_backend(api_key):
+    # The SDK is imported and the client built on the first synthesis
+    def create_client():
+        from elevenlabs.client import ElevenLabs
+        return ElevenLabs(api_key=api_key)
+
+    client = Lazy(create_client)
+
+    def synthesize(text, voice, model):
+        audio = client.get().generate(text=text, voice=voice, model=model)
+        # Older SDKs return bytes, newer ones an iterator of chunks
+        return audio if isinstance(audio, bytes) else b''.join(audio)
+
+    return synthesize
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class SpeechCache:
+    def __init__(self, directory, url_prefix, max_bytes, synthesize):
+        self.directory = directory
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_bytes = max_bytes
+        self.synthesize = synthesize
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'hits': 0, 'misses': 0, 'shared': 0, 'evictions': 0}
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.mp3')
+
+    def _url(self, key):
+        return f'{self.url_prefix}/{key}.mp3'
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            # Evicted between the lookup and now
+            return False
+
+    def get_or_synthesize(self, text, voice, model=DEFAULT_MODEL):
+        # Returns (url, cached)
+        key = speech_key(text, voice, model)
+        path = self._path(key)
+        if self._touch(path):
+            self._count('hits')
+            return self._url(key), True
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            self._count('shared')
+            return self._url(key), True
+
+        try:
+            self._count('misses')
+            with metrics.external('elevenlabs'):
+                audio = self.synthesize(text, voice, model)
+            # Write to a temp file and rename so readers never see a
+            # partial file, even from another worker
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(audio)
+                os.replace(tmp_path, path)
+            except Exception:
+                os.remove(tmp_path)
+                raise
+            self._evict(keep=path)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return self._url(key), False
+
+    def _evict(self, keep):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.mp3'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                self._count('evictions')
+            except FileNotFoundError:
+                pass
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+def init_app(app, synthesize=None):
+    folder = app.config['TTS_CACHE_FOLDER']
+    url_prefix = '/static/' + os.path.relpath(folder, app.static_folder).replace(os.sep, '/')
+    app.extensions['speech_cache'] = SpeechCache(
+        folder,
+        url_prefix,
+        app.config['TTS_CACHE_MAX_BYTES'],
+        synthesize or elevenlabs_backend(app.config['ELEVENLABS_API_KEY'])
+    )
+
+
+speech_cache = LocalProxy(lambda: current_app.extensions['speech_cache'])
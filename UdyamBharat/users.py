@@ -0,0 +1,105 @@
+from bson import ObjectId
+from flask import current_app
+from werkzeug.local import LocalProxy
+from cache import create_cache, MISSING
+from database import db
+
+# Flask-Login calls load_user on every authenticated request, including
+# each cart call from main.js. The four fields it needs are cached as a
+# tuple under users:<id>, so most requests never reach MongoDB. Anything
+# that changes those fields must go through update_user() (or call
+# invalidate_user()) so other requests stop seeing the old values.
+
+USER_FIELDS = ('email', 'role', 'name')
+USER_PROJECTION = {field: 1 for field in USER_FIELDS}
+
+
+class User:
+    # Flask-Login needs get_id() and the is_* flags; a slotted class keeps
+    # the per-request object small instead of carrying UserMixin's __dict__
+    __slots__ = ('id', 'email', 'role', 'name')
+
+    is_authenticated = True
+    is_active = True
+    is_anonymous = False
+
+    def __init__(self, user_data):
+        self.id = str(user_data['_id'])
+        self.email = user_data['email']
+        self.role = user_data['role']
+        self.name = user_data['name']
+
+    @classmethod
+    def from_record(cls, record):
+        user = cls.__new__(cls)
+        user.id, user.email, user.role, user.name = record
+        return user
+
+    def to_record(self):
+        return (self.id, self.email, self.role, self.name)
+
+    def get_id(self):
+        return self.id
+
+    def __eq__(self, other):
+        if isinstance(other, User):
+            return self.id == other.id
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+def _cache_key(user_id):
+    return f'users:{user_id}'
+
+
+def load_user(user_id):
+    if not ObjectId.is_valid(user_id):
+        return None
+
+    record = user_cache.get(_cache_key(user_id))
+    if record is not MISSING:
+        return User.from_record(record)
+
+    user_data = db.users.find_one({'_id': ObjectId(user_id)}, USER_PROJECTION)
+    if not user_data:
+        return None
+
+    user = User(user_data)
+    user_cache.set(_cache_key(user_id), user.to_record())
+    return user
+
+
+def invalidate_user(user_id):
+    user_cache.delete(_cache_key(user_id))
+
+
+def update_user(user_id, changes):
+    result = db.users.update_one({'_id': ObjectId(user_id)}, {'$set': changes})
+    invalidate_user(user_id)
+    return result
+
+
+def user_cache_stats():
+    stats = user_cache.stats()
+    # Every hit is a users query that load_user did not have to make
+    stats['lookups_saved'] = stats['hits']
+    return stats
+
+
+def init_app(app):
+    app.extensions['user_cache'] = create_cache(
+        app.config['USER_CACHE_BACKEND'],
+        app.config['USER_CACHE_MAX_ENTRIES'],
+        app.config['USER_CACHE_TTL'],
+        app.config['USER_CACHE_PATH'],
+        name='users'
+    )
+
+
+user_cache = LocalProxy(lambda: current_app.extensions['user_cache'])